@@ -1 +1,9 @@
-from .compiler import Compiler
\ No newline at end of file
+__all__ = ['Compiler']
+
+
+def __getattr__(name):
+    # 按需导入，使只依赖标准库的子模块（如client）无需加载lark与llvmlite
+    if name == 'Compiler':
+        from .compiler import Compiler
+        return Compiler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
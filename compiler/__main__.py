@@ -1,25 +1,87 @@
 import argparse
+import subprocess
 import sys
 from pathlib import Path
 
 from compiler.error import CompileError
-from compiler.compiler import Compiler
+from compiler.cache import BUILD_CACHE_DIR
+from compiler.client import SOCKET_PATH
+from compiler.compiler import EMITS, Compiler
+from compiler.ir.options import OPT_LEVELS, PASSES
 
 
 def main():
     parser = argparse.ArgumentParser(prog="AnanasCC", description="一个简单的C编译器。")
-    parser.add_argument("input_file", help="要编译的C源文件路径。")
+    parser.add_argument("input_files", nargs='*', metavar="input_file",
+                        help="要编译的C源文件路径，可指定多个文件。")
     parser.add_argument("-e", "--execute", action="store_true", help="编译完成后立即执行程序。")
+    parser.add_argument("--jit", action="store_true", help="与--execute一起使用，在进程内即时编译执行，不生成可执行文件。")
+    parser.add_argument("-O", dest="opt_level", choices=OPT_LEVELS, default='2',
+                        help="优化级别（-O0/-O1/-O2/-O3/-Os/-Oz），默认为-O2，-O0跳过优化。")
+    parser.add_argument("--passes", metavar="PIPELINE",
+                        help=f"以逗号分隔的自定义优化流水线，替代默认流水线，可用的遍有: {', '.join(PASSES)}。")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="多文件编译时的并行进程数，默认为CPU核数。")
+    parser.add_argument("--link", action="store_true", help="将多个文件链接为一个可执行文件，而非逐文件输出。")
+    parser.add_argument("--time-report", action="store_true",
+                        help="输出各阶段的耗时、CPU时间、内存峰值与LLVM各遍耗时，并在工作目录生成time_report.json，仅限单个文件。")
+    parser.add_argument("--target", metavar="TRIPLE", help="目标三元组，默认为宿主机。")
+    parser.add_argument("--cpu", help="目标CPU，默认为宿主CPU（指定--target时为通用CPU）。")
+    parser.add_argument("--features", help="目标CPU特性，如'+avx2,-sse4.2'，默认与--cpu对应。")
+    parser.add_argument("--syntax-only", action="store_true",
+                        help="只做词法、语法与语义检查，不生成IR，也不调用LLVM与clang。")
+    parser.add_argument("--emit", choices=EMITS, default='exe',
+                        help="在指定阶段后停止并输出：单词表、AST、原始IR、优化IR、汇编、目标文件或可执行文件（默认）。")
+    parser.add_argument("--cache", action="store_true",
+                        help="使用当前用户私有的编译缓存，未修改的文件重新编译时跳过前端与优化。")
+    parser.add_argument("--serve", action="store_true",
+                        help="作为常驻编译服务运行，通过python -m compiler.client提交编译请求。")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="编译服务的套接字路径。")
 
     args = parser.parse_args()
+    if args.passes:
+        unknown = [name for name in args.passes.split(',') if name not in PASSES]
+        if unknown:
+            parser.error(f"未知的优化遍: {', '.join(unknown)}")
+    if args.execute and (args.syntax_only or args.emit != 'exe'):
+        parser.error("--execute只能在生成可执行文件时使用")
+    if args.link and (args.syntax_only or args.emit != 'exe'):
+        parser.error("--link只能在生成可执行文件时使用")
+
+    if args.time_report and (args.serve or len(args.input_files) > 1 or args.link):
+        # 多文件编译在工作进程中进行，编译服务的输出不属于某次请求，都无法按文件报告
+        parser.error("--time-report只能在编译单个文件时使用")
+
+    options = dict(triple=args.target, cpu=args.cpu, features=args.features,
+                   opt_level=args.opt_level, pipeline=args.passes, time_report=args.time_report,
+                   cache_dir=BUILD_CACHE_DIR if args.cache else None)
+    if args.serve:
+        # 编译服务：文法、目标机器等只构建一次，由各次请求共享；Windows下没有Unix套接字，仅在使用时导入
+        from compiler.server import serve
+        serve(args.socket, **options)
+        return
+    if not args.input_files:
+        parser.error("未指定输入文件")
 
     # 验证输入文件是否存在
-    input_path = Path(args.input_file)
-    if not input_path.is_file():
-        print(f"错误: 输入文件 '{input_path}' 不存在或不是一个文件。", file=sys.stderr)
-        sys.exit(1)
+    input_paths = [Path(input_file) for input_file in args.input_files]
+    for input_path in input_paths:
+        if not input_path.is_file():
+            print(f"错误: 输入文件 '{input_path}' 不存在或不是一个文件。", file=sys.stderr)
+            sys.exit(1)
+
+    if args.syntax_only or args.emit != 'exe':
+        # 提前停止：逐文件处理，只导入用到的阶段
+        sys.exit(stop_early(input_paths, args, options))
+    if len(input_paths) > 1 or args.link:
+        # 多文件：并行编译，最后按输入顺序链接或逐文件输出并汇总诊断信息
+        from compiler.batch import Batch
+        batch = Batch(jobs=args.jobs, link=args.link, **options)
+        units, _ = batch.compile([path.resolve() for path in input_paths], execute=args.execute, jit=args.jit)
+        sys.exit(1 if any(unit.error is not None for unit in units) else 0)
 
     # 确定工作目录和文件路径
+    input_path = input_paths[0]
     work_dir = input_path.parent.resolve()
     file_path = str(input_path.resolve())
 
@@ -27,13 +89,39 @@ def main():
     try:
         print(f"工作目录: {work_dir}")
         print(f"开始编译: {file_path}")
-        compiler = Compiler(work_dir=str(work_dir))
-        compiler.compile(file_path, execute=args.execute)
+        compiler = Compiler(work_dir=str(work_dir), **options)
+        compiler.compile(file_path, execute=args.execute, jit=args.jit)
         print("\n编译成功！")
 
     except CompileError as e:
         print(f"\n编译失败: {e}", file=sys.stderr)
         sys.exit(1)
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        # 链接失败，或即时编译时缺少main与未定义的符号
+        print(f"\n链接失败: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def stop_early(input_paths, args, options):
+    compiler = Compiler(**options)
+    failed = False
+    for input_path in input_paths:
+        file_path = str(input_path.resolve())
+        try:
+            if args.syntax_only:
+                report = compiler.check(file_path).report
+                if report.enabled:
+                    print('\n' + report.table())
+                    report.save(input_path.parent.resolve())
+            else:
+                # 单个文件的输出沿用默认文件名，多个文件以各自的源文件名命名
+                file_name = input_path.stem if len(input_paths) > 1 else 'output'
+                unit = compiler.compile(file_path, file_name=file_name, emit=args.emit)
+                print(f"已生成: {unit.output}")
+        except CompileError as e:
+            print(f"{input_path}: {e}", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
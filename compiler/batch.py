@@ -0,0 +1,139 @@
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from llvmlite import binding
+
+from compiler.compiler import Compiler
+from compiler.ir.target import thread_context
+from compiler.x86 import ir_to_obj, obj_to_exe, run_exe, run_jit
+
+
+class Unit:
+    # 一个翻译单元的编译结果，在进程之间传递，LLVM模块以位码形式保存
+    def __init__(self, file_path, bitcode=None, error=None):
+        self.file_path = file_path
+        self.bitcode = bitcode
+        self.error = error
+        self.output = None
+        self.exit_code = None
+
+
+COMPILER = None
+
+
+def init_worker(options):
+    # 每个工作进程持有一个预热的编译器，逐文件复用
+    global COMPILER
+    COMPILER = Compiler(**options)
+
+
+def translate(file_path, compiler=None):
+    try:
+        module = (compiler or COMPILER).translate(file_path).module
+        return Unit(file_path, bitcode=module.as_bitcode())
+    except Exception as e:
+        # 任何错误都只记录在该文件上，不能经进程池中断整批编译
+        return Unit(file_path, error=str(e) or e.__class__.__name__)
+
+
+class Batch:
+    # 多文件编译：前端、IR生成与优化在进程池中并行，链接或逐文件输出在最后按输入顺序进行
+    def __init__(self, jobs=None, link=False, **options):
+        self.jobs = jobs or os.cpu_count()
+        self.link = link
+        # 链接时各翻译单元的函数可能被其他单元调用，不能剪除
+        options = self.options = dict(options, whole_program=not link)
+        self.compiler = Compiler(**options)
+        self.target_machine = self.compiler.target_machine
+
+    def translate(self, file_paths):
+        if self.jobs == 1 or len(file_paths) == 1:
+            return [translate(file_path, self.compiler) for file_path in file_paths]
+        chunksize = max(1, len(file_paths) // (self.jobs * 4))
+        with ProcessPoolExecutor(self.jobs, initializer=init_worker, initargs=(self.options,)) as executor:
+            # map按提交顺序返回结果，输出顺序与工作进程的调度无关
+            return list(executor.map(translate, file_paths, chunksize=chunksize))
+
+    def compile(self, file_paths, work_dir=None, execute=False, jit=False):
+        units = self.translate([str(file_path) for file_path in file_paths])
+        done = [unit for unit in units if unit.error is None]
+        output = None
+        if self.link:
+            # 有文件出错时不链接也不执行，缺少的定义会使程序在运行时出错
+            if len(done) == len(units):
+                output = self.link_units(done, work_dir or Path(done[0].file_path).parent, execute and jit)
+            execute = execute and output is not None
+        elif not (execute and jit):
+            # 目标文件生成与clang链接都会释放GIL，以线程并行
+            with ThreadPoolExecutor(self.jobs) as executor:
+                list(executor.map(lambda unit: self.emit_unit(unit, work_dir), done))
+
+        if execute:
+            self.execute(units, output, jit)
+        self.report(units, output)
+        return units, output
+
+    def emit_unit(self, unit, work_dir):
+        output_dir = work_dir or Path(unit.file_path).parent
+        name = Path(unit.file_path).stem
+        try:
+            module = binding.parse_bitcode(unit.bitcode, context=thread_context())
+            obj = ir_to_obj(module, output_dir, name, target_machine=self.target_machine)
+            unit.output = obj_to_exe(obj, output_dir, name)
+        except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+            unit.error = f'链接失败: {e}'
+
+    def link_units(self, units, work_dir, jit):
+        # 在LLVM中合并各模块后统一生成一个目标文件，私有符号（字符串常量）重名时自动改名
+        module = binding.parse_bitcode(units[0].bitcode, context=thread_context())
+        for unit in units[1:]:
+            try:
+                module.link_in(binding.parse_bitcode(unit.bitcode, context=thread_context()))
+            except RuntimeError as e:
+                unit.error = f'链接失败: {e}'
+                return None
+        if jit:
+            return module
+        try:
+            return obj_to_exe(ir_to_obj(module, work_dir, target_machine=self.target_machine), work_dir)
+        except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+            units[0].error = f'链接失败: {e}'
+            return None
+
+    @staticmethod
+    def execute(units, output, jit):
+        # 程序依次执行，输出不会交错
+        # 即时编译时缺少main或未定义的符号与链接失败一样报告
+        if output is not None:
+            try:
+                exit_code = run_jit(output) if jit else run_exe(output)
+            except RuntimeError as e:
+                units[0].error = f'链接失败: {e}'
+                return
+            print(f'\n进程已结束，退出代码为 {exit_code}')
+            return
+        for unit in units:
+            if unit.error is not None:
+                continue
+            print(f'==> {unit.file_path} <==')
+            try:
+                if jit:
+                    unit.exit_code = run_jit(binding.parse_bitcode(unit.bitcode, context=thread_context()))
+                else:
+                    unit.exit_code = run_exe(unit.output)
+            except RuntimeError as e:
+                unit.error = f'链接失败: {e}'
+                continue
+            print(f'\n进程已结束，退出代码为 {unit.exit_code}')
+
+    @staticmethod
+    def report(units, output):
+        # 按输入顺序汇总各文件的诊断信息
+        failed = [unit for unit in units if unit.error is not None]
+        for unit in failed:
+            print(f'{unit.file_path}: {unit.error}')
+        if output is not None and not isinstance(output, binding.ModuleRef):
+            print(f'已链接: {output}')
+        print(f'共 {len(units)} 个文件，成功 {len(units) - len(failed)} 个，失败 {len(failed)} 个')
@@ -0,0 +1,119 @@
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from pathlib import Path
+
+from compiler.utils import CACHE_VERSION, USER_CACHE_DIR, private_dir
+
+# AST层以pickle保存，缓存目录中的文件等同于可执行代码：缓存只放在当前用户私有的目录下，不放在源代码旁边
+# 默认为用户缓存目录下的ananascc，可通过环境变量ANANASCC_BUILD_CACHE修改；超过容量上限时按最近使用时间淘汰
+BUILD_CACHE_DIR = Path(os.environ.get('ANANASCC_BUILD_CACHE') or USER_CACHE_DIR)
+CACHE_SIZE = 64 * 2 ** 20
+
+
+@functools.cache
+def compiler_version():
+    # 编译器自身的源文件与文法参与哈希，修改编译器后缓存自动失效
+    root = Path(__file__).parent
+    digest = hashlib.sha256()
+    for path in sorted(root.rglob('*')):
+        if path.suffix in ('.py', '.lark'):
+            digest.update(path.relative_to(root).as_posix().encode('utf-8'))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class BuildCache:
+    # 内容寻址的编译缓存，键为源代码、编译器版本与编译选项的哈希
+    # 位码层（.bc）保存优化后的模块，命中时跳过整个前端、IR生成与优化
+    # AST层（.ast）保存语义分析、折叠与剪枝后的AST，与优化级别和目标无关，改变这些选项时仍可复用
+    def __init__(self, cache_dir=BUILD_CACHE_DIR, max_size=CACHE_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.enabled = self.private()
+
+    def private(self):
+        return private_dir(self.cache_dir)
+
+    @staticmethod
+    def key(code, *options):
+        key = '\n'.join([code, compiler_version(), repr(options), str(CACHE_VERSION), '%d.%d' % sys.version_info[:2]])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def load(self, key, suffix):
+        if not self.enabled:
+            return None
+        path = self.cache_dir / f'{key}{suffix}'
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 以修改时间记录最近一次使用
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def store(self, key, suffix, data):
+        # 先写临时文件再原子地替换，多个进程同时编译同一文件时读到的总是完整的缓存
+        if not self.enabled:
+            return
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.cache_dir / f'{key}{suffix}')
+        except OSError:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.name.endswith(('.bc', '.ast')):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except OSError:
+                pass
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # 可能已被其他进程淘汰
+                pass
+            size -= entry_size
+
+    # ===============  分 层  ===============
+
+    def load_tree(self, code, *options):
+        data = self.load(self.key(code, *options), '.ast')
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # 缓存损坏时视为未命中，重新编译后覆盖
+            return None
+
+    def store_tree(self, code, tree, *options):
+        try:
+            data = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            # 嵌套过深的AST不缓存
+            return
+        self.store(self.key(code, *options), '.ast', data)
+
+    def load_bitcode(self, code, *options):
+        return self.load(self.key(code, *options), '.bc')
+
+    def store_bitcode(self, code, bitcode, *options):
+        self.store(self.key(code, *options), '.bc', bitcode)
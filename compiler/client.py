@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from pathlib import Path
+
+# 客户端只依赖标准库，不导入lark与llvmlite，启动开销只有解释器本身
+SOCKET_PATH = os.environ.get('ANANASCC_SOCKET', str(Path(tempfile.gettempdir()) / 'ananascc.sock'))
+
+
+def send(sock, message):
+    sock.sendall((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+def receive(stream):
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('编译服务已断开连接')
+    return json.loads(line)
+
+
+class Client:
+    # 编译服务的客户端，一个连接上可以依次发送多个请求
+    def __init__(self, socket_path=SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(socket_path))
+        self.stream = self.sock.makefile('rb')
+
+    def request(self, **message):
+        send(self.sock, message)
+        return receive(self.stream)
+
+    def compile(self, file_path, work_dir=None, execute=False, jit=False, **options):
+        # 源代码由客户端读取后发送，服务端无需访问客户端的工作目录也能编译
+        file_path = Path(file_path).resolve()
+        return self.request(action='compile', file=str(file_path), source=file_path.read_text(encoding='utf-8'),
+                            work_dir=str(Path(work_dir or file_path.parent).resolve()),
+                            execute=execute, jit=jit, options=options)
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="AnanasCC-client", description="向编译服务（python -m compiler --serve）提交编译请求。")
+    parser.add_argument("input_files", nargs="*", metavar="input_file", help="要编译的C源文件路径，可指定多个文件。")
+    parser.add_argument("-e", "--execute", action="store_true", help="编译完成后立即执行程序。")
+    parser.add_argument("--jit", action="store_true", help="与--execute一起使用，在服务进程内即时编译执行。")
+    parser.add_argument("-O", dest="opt_level", choices=['0', '1', '2', '3', 's', 'z'], default='2', help="优化级别。")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="编译服务的套接字路径。")
+    parser.add_argument("--shutdown", action="store_true", help="请求编译服务退出。")
+    args = parser.parse_args()
+
+    failed = False
+    try:
+        client = Client(args.socket)
+    except OSError as e:
+        print(f"错误: 无法连接编译服务 '{args.socket}': {e}", file=sys.stderr)
+        sys.exit(2)
+    try:
+        with client:
+            for input_file in args.input_files:
+                response = client.compile(input_file, execute=args.execute, jit=args.jit, opt_level=args.opt_level)
+                for diagnostic in response['diagnostics']:
+                    print(f'{input_file}: {diagnostic}', file=sys.stderr)
+                failed = failed or bool(response['diagnostics'])
+                if response['stdout']:
+                    print(response['stdout'], end='')
+                if response['exit_code'] is not None:
+                    print(f'\n进程已结束，退出代码为 {response["exit_code"]}')
+                elif response['output']:
+                    print(f'{input_file}: {response["output"]}')
+            if args.shutdown:
+                client.request(action='shutdown')
+    except OSError as e:
+        print(f"错误: 与编译服务的连接中断: {e}", file=sys.stderr)
+        sys.exit(2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
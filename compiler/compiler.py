@@ -1,50 +1,249 @@
+import functools
 import os
-import subprocess
+import threading
+from pathlib import Path
 
+from compiler.cache import BuildCache
 from compiler.error import CompileError
-from compiler.ir import Generator
-from compiler.ir import Optimizer
+from compiler.ir.options import OPT_LEVELS
 from compiler.lexer import Lexer
 from compiler.parser import Parser
-from compiler.semantic import Analyzer
-from compiler.utils import read_file
-from compiler.x86 import ir_to_x86, x86_to_exe
+from compiler.report import TimeReport
+from compiler.semantic import Analyzer, Folder, Pruner
+from compiler.utils import read_file, write_file
+
+# 可以停止的阶段，依次为单词表、AST、原始IR、优化IR、汇编、目标文件与可执行文件
+# 后端（llvmlite）与clang只在需要生成IR时才导入和调用
+EMITS = ('tokens', 'ast', 'ir', 'opt-ir', 'asm', 'obj', 'exe')
+
+
+class Translation:
+    # 一个翻译单元在一次compile调用中的全部状态
+    def __init__(self, file_path, lexer, parser, report):
+        self.file_path = file_path
+        self.lexer = lexer
+        self.parser = parser
+        self.report = report
+        self.tokens = None
+        self.tree = None
+        self.generator = None
+        self.optimizer = None
+        self.module = None
+        self.output = None
+        self.exit_code = None
+        self.error = None
+
+    def save(self, file_path=''):
+        # 提前停止时只导出已经完成的阶段
+        self.lexer.save(file_path)
+        if self.parser.ast is not None:
+            self.parser.save(file_path, self.lexer.tokens)
+        if self.generator is not None:
+            self.generator.save(file_path)
+        if self.optimizer is not None and self.optimizer.module is not None:
+            self.optimizer.save(file_path)
 
 
 class Compiler:
-    def __init__(self, work_dir):
-        os.makedirs(work_dir, exist_ok=True)
+    # 文法、目标机器等构建代价高且与翻译单元无关的部分按实例保留，符号表、LLVM模块等逐次新建
+    # 同一实例可循环或在多个线程中反复编译；词法/语法分析器在解析时保存状态，按线程各持有一份
+    def __init__(self, work_dir=None, fused=False, triple=None, cpu=None, features=None, opt_level='2', pipeline=None,
+                 time_report=False, cache_dir=None, whole_program=True):
+        if work_dir is not None:
+            os.makedirs(work_dir, exist_ok=True)
         self.work_dir = work_dir
+        self.fused = fused
+        # 默认为宿主机生成代码，可指定目标三元组、CPU与特性覆盖
+        self.speed_level, self.size_level = OPT_LEVELS[opt_level]
+        self.target = (triple, cpu, features)
+        self.pipeline = pipeline
+        self.time_report = time_report
+        # 与其他翻译单元链接时不能剪除main不可达的函数
+        self.whole_program = whole_program
+        # 给出缓存目录时缓存AST与优化后的位码，未修改的文件重新编译时跳过前端
+        self.cache = BuildCache(cache_dir) if cache_dir is not None else None
+
+        self.local = threading.local()
+        self.front_end()
+        self.last = None
+
+    @functools.cached_property
+    def target_machine(self):
+        # 第一次生成IR时才创建，只做语法检查时不初始化LLVM
+        from compiler.ir.target import create_target_machine
+        return create_target_machine(*self.target, opt=self.speed_level)
+
+    @functools.cached_property
+    def options(self):
+        # 影响优化后模块的全部选项，目标以解析后的三元组、CPU与特性表示，宿主机变化时缓存不会误用
+        from compiler.ir.target import resolve_target
+        return resolve_target(*self.target), self.speed_level, self.size_level, self.pipeline, self.whole_program
+
+    def front_end(self):
+        local = self.local
+        if not hasattr(local, 'parser'):
+            # 单遍模式下词法分析器仅用于导出单词表，使用无需构建文法的正则引擎
+            local.lexer = Lexer(engine='regex') if self.fused else Lexer()
+            local.parser = Parser(inline=True, fused=self.fused)
+        return local.lexer, local.parser
+
+    def translate(self, file_path, code=None, stop=None):
+        # 前端、IR生成与优化，得到优化后的内存中模块；给出code时不再读取文件
+        # stop为'tokens'、'syntax'（语义检查后）、'ast'或'ir'时在该阶段后停止
+        lexer, parser = self.front_end()
+        parser.ast = None
+        unit = Translation(file_path, lexer, parser, TimeReport(enabled=self.time_report))
+        self.last = unit
+        report = unit.report
 
-        self.lexer = Lexer()
-        self.parser = Parser()
-        self.analyzer = Analyzer()
-        self.generator = Generator()
-        self.optimizer = Optimizer()
+        if code is None:
+            with report.stage('read'):
+                code = read_file(file_path)
+        if stop == 'tokens':
+            with report.stage('lex'):
+                unit.tokens = lexer.lex(code)
+            return unit
 
-    def compile(self, file_path, execute=False):
-        code = read_file(file_path)
+        cache = self.cache if stop != 'syntax' else None
+        if cache is not None:
+            # 命中时前端不会运行，单词表在导出时才按源代码重新扫描
+            lexer.code, lexer.tokens = code, None
+            with report.stage('cache'):
+                if stop is None:
+                    unit.module = self.load_module(cache, code)
+                if unit.module is None:
+                    unit.tree = cache.load_tree(code, self.whole_program)
+            if unit.module is not None:
+                return unit
 
+        if unit.tree is None:
+            unit.tree = self.front(unit, code, stop)
+            if stop == 'syntax':
+                return unit
+            if cache is not None:
+                cache.store_tree(code, unit.tree, self.whole_program)
+        if stop == 'ast':
+            return unit
+
+        from compiler.ir import Generator, Optimizer
+        unit.generator = Generator(self.target_machine)
+        unit.optimizer = Optimizer(self.speed_level, self.size_level, self.target_machine, self.pipeline)
+        with report.stage('generate'):
+            unit.module = unit.generator.generate(unit.tree)
+        if stop == 'ir':
+            return unit
+        with report.stage('optimize', llvm=True):
+            unit.module = unit.optimizer.optimize(unit.module)
+        if cache is not None:
+            cache.store_bitcode(code, unit.module.as_bitcode(), *self.options)
+        return unit
+
+    def front(self, unit, code, stop):
+        lexer, parser, report = unit.lexer, unit.parser, unit.report
+        if self.fused:
+            with report.stage('parse'):
+                lexer.code, lexer.tokens = code, None
+                tree = parser.parse_text(code)
+        else:
+            # 单词流与语法分析交替进行，两者合计为一个阶段
+            with report.stage('lex+parse'):
+                tokens = lexer.lex(code, stream=True)
+                tree = parser.parse(tokens)
+        with report.stage('analyze'):
+            tree = Analyzer().analyze(tree)
+        if stop == 'syntax':
+            return tree
+        with report.stage('fold'):
+            tree = Folder().fold(tree)
+        with report.stage('prune'):
+            tree = Pruner(self.whole_program).prune(tree)
+        return tree
+
+    def load_module(self, cache, code):
+        bitcode = cache.load_bitcode(code, *self.options)
+        if bitcode is None:
+            return None
+        from llvmlite import binding
+        from compiler.ir.target import thread_context
         try:
-            tokens = self.lexer.lex(code)
-            tree = self.parser.parse(tokens)
-            tree = self.analyzer.analyze(tree)
-        except CompileError as e:
-            print(e)
+            return binding.parse_bitcode(bitcode, context=thread_context())
+        except RuntimeError:
+            return None
+
+    def check(self, file_path, code=None):
+        # 仅做词法、语法与语义检查，错误以CompileError抛出
+        return self.translate(file_path, code, stop='syntax')
+
+    def compile(self, file_path, execute=False, jit=False, file_name='output', emit='exe'):
+        # emit指定输出的阶段，只有生成可执行文件（或即时编译）时才能执行
+        if emit not in EMITS:
+            raise ValueError(f"未知的输出阶段 '{emit}'，可用的有: {', '.join(EMITS)}")
+        unit = self.translate(file_path, stop=emit if emit in ('tokens', 'ast', 'ir') else None)
+        report = unit.report
+        work_dir = Path(self.work_dir or Path(file_path).parent)
 
-        ir = self.generator.generate(tree)
-        ir = self.optimizer.optimize(ir)
+        if emit != 'exe':
+            with report.stage('emit', llvm=emit in ('asm', 'obj')):
+                unit.output = self.emit(unit, emit, work_dir, file_name)
+        elif execute and jit:
+            # 即时编译并在进程内执行main，无需链接和启动新进程
+            from compiler.x86 import run_jit
+            with report.stage('jit'):
+                unit.exit_code = run_jit(unit.module)
+            print(f'\n进程已结束，退出代码为 {unit.exit_code}')
+        else:
+            from compiler.x86 import ir_to_obj, obj_to_exe, run_exe
+            with report.stage('emit', llvm=True):
+                obj = ir_to_obj(unit.module, work_dir, file_name, target_machine=self.target_machine)
+            with report.stage('link'):
+                unit.output = obj_to_exe(obj, work_dir, file_name)
 
-        x86 = ir_to_x86(ir, self.work_dir)
-        exe = x86_to_exe(x86, self.work_dir)
+            if execute:
+                with report.stage('execute'):
+                    unit.exit_code = run_exe(unit.output)
+                print(f'\n进程已结束，退出代码为 {unit.exit_code}')
 
-        if execute:
-            result = subprocess.run(exe)
-            exit_code = result.returncode if result.returncode <= (2**31 - 1) else result.returncode - 2**32
-            print(f'\n进程已结束，退出代码为 {exit_code}')
+        if report.enabled:
+            print('\n' + report.table())
+            report.save(work_dir)
+        return unit
+
+    def emit(self, unit, stage, work_dir, file_name):
+        if stage in ('tokens', 'ast', 'ir', 'opt-ir'):
+            if stage == 'tokens':
+                content, output_path = unit.lexer.tabular(unit.tokens), work_dir / f'{file_name}.tokens'
+            elif stage == 'ast':
+                content, output_path = unit.tree.pretty(), work_dir / f'{file_name}.ast'
+            else:
+                content, output_path = str(unit.module), work_dir / f'{file_name}.ll'
+            write_file(content, output_path)
+            return output_path
+        from compiler.x86 import ir_to_obj, ir_to_x86
+        convert = ir_to_x86 if stage == 'asm' else ir_to_obj
+        return convert(unit.module, work_dir, file_name, target_machine=self.target_machine)
+
+    def compile_many(self, file_paths, execute=False, jit=False, threads=None):
+        # 在线程池中编译多个文件，结果按输入顺序返回，出错的文件记录诊断信息而不中断其余文件
+        # 输出文件以源文件名命名，重名时追加序号
+        import subprocess
+        from concurrent.futures import ThreadPoolExecutor
+        names, seen = [], set()
+        for i, file_path in enumerate(file_paths):
+            name = Path(file_path).stem
+            names.append(name if name not in seen else f'{name}_{i}')
+            seen.add(names[-1])
+
+        def compile_one(file_path, file_name):
+            try:
+                return self.compile(file_path, execute, jit, file_name)
+            except (CompileError, RuntimeError, OSError, subprocess.CalledProcessError) as e:
+                unit = Translation(file_path, None, None, None)
+                unit.error = e
+                return unit
+
+        with ThreadPoolExecutor(threads) as executor:
+            return list(executor.map(compile_one, file_paths, names))
 
     def save(self, file_path=''):
-        self.lexer.save(file_path)
-        self.parser.save(file_path)
-        self.generator.save(file_path)
-        self.optimizer.save(file_path)
+        # 导出最近一次编译的中间结果
+        self.last.save(file_path)
@@ -1,2 +1,12 @@
-from .generator import Generator
-from .optimizer import Optimizer
\ No newline at end of file
+__all__ = ['Generator', 'Optimizer']
+
+
+def __getattr__(name):
+    # 按需导入，只用到编译选项（options）时不加载llvmlite
+    if name == 'Generator':
+        from .generator import Generator
+        return Generator
+    if name == 'Optimizer':
+        from .optimizer import Optimizer
+        return Optimizer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,69 +1,87 @@
 import codecs
+import math
 from pathlib import Path
 
-from lark.visitors import Interpreter
 from llvmlite import ir, binding
 
+from compiler.error import SemanticError
+from compiler.ir.target import create_target_machine, thread_context
+from compiler.semantic.folder import to_float, wrap
 from compiler.semantic.symbol import *
 from compiler.semantic.type import *
 from compiler.tree import *
 from compiler.utils import write_file
 
-binding.initialize()
-binding.initialize_native_target()
-binding.initialize_native_asmprinter()
 
-
-class Generator(Interpreter):
-    def __init__(self):
+class Generator(Visitor):
+    def __init__(self, target_machine=None):
         super().__init__()
-        self.module = ir.Module(name='main_module')
+        self.module = ir.Module(name='main_module', context=ir.Context())
         self.builder = None
-        self.ir = None
+        self.module_ref = None
 
         self.curr_func = None
         self.loop_stack = []
         self.strings = {}
-        self.structs = {}
+        self.types = {}
+        self.layouts = {}
 
         void_type = ir.IntType(8).as_pointer()
         func_type = ir.FunctionType(ir.IntType(32), [void_type], var_arg=True)
         ir.Function(self.module, func_type, name="printf")
         ir.Function(self.module, func_type, name="scanf")
 
-        self.module.triple = 'x86_64-pc-windows-msvc19.44.35209'
+        self.target_machine = target_machine or create_target_machine()
+        self.target_data = self.target_machine.target_data
+        self.data_layout = DataLayout(str(self.target_data))
+        self.module.triple = self.target_machine.triple
+        self.module.data_layout = str(self.target_data)
 
     # ===============  基础方法  ===============
 
     def generate(self, tree):
+        # llvmlite构建的IR只能经文本交给LLVM，此后各阶段直接共享内存中的模块，文本仅在保存时生成
         self.visit(tree)
-        self.ir = str(self.module)
         try:
-            mod = binding.parse_assembly(self.ir)
-            mod.verify()
+            self.module_ref = binding.parse_assembly(str(self.module), context=thread_context())
+            self.module_ref.verify()
         except RuntimeError as e:
             print("IR报错了！！！！不！！！！！！！！！")
             raise e
-        return self.ir
+        return self.module_ref
 
     def save(self, file_path=''):
-        write_file(self.ir, Path(file_path) / '04 org_ir.txt')
+        write_file(str(self.module), Path(file_path) / '04 org_ir.txt')
 
     # ===============  辅助方法  ===============
 
     def get_type(self, ctype):
+        # 按类型对象缓存降级结果；类型已唯一化，以id为键可区分长度不同的数组
+        entry = self.types.get(id(ctype))
+        if entry is None:
+            entry = self.types[id(ctype)] = (self.lower_type(ctype), ctype)
+        return entry[0]
+
+    def get_layout(self, ctype):
+        # 类型的ABI大小与对齐由语义层按目标数据布局统一计算，降级得到的LLVM类型与之一致
+        entry = self.layouts.get(id(ctype))
+        if entry is None:
+            entry = self.layouts[id(ctype)] = (*layout_of(ctype, self.data_layout), ctype)
+        return entry[:2]
+
+    def lower_type(self, ctype):
         if isinstance(ctype, BasicType):
-            if ctype == VOID:
+            if ctype is VOID:
                 return ir.VoidType()
-            elif ctype == INT:
+            elif ctype is INT:
                 return ir.IntType(32)
-            elif ctype == FLOAT:
+            elif ctype is FLOAT:
                 return ir.FloatType()
-            elif ctype == CHAR:
+            elif ctype is CHAR:
                 return ir.IntType(8)
-            elif ctype == BOOL:
+            elif ctype is BOOL:
                 return ir.IntType(1)
-            elif ctype == NULL:
+            elif ctype is NULL:
                 return ir.IntType(8).as_pointer()
         elif isinstance(ctype, PointerType):
             return self.get_type(ctype.type).as_pointer()
@@ -76,16 +94,20 @@ class Generator(Interpreter):
             param_types = [self.get_type(p) for p in ctype.params]
             return ir.FunctionType(return_type, param_types)
         elif isinstance(ctype, CompoundType):
-            if ctype.name in self.structs:
-                return self.structs[ctype.name]
+            # 先登记命名结构体再降级成员，成员中指向自身的指针可直接取到它
             struct_type = self.module.context.get_identified_type(ctype.name)
-            self.structs[ctype.name] = struct_type
-            member_types = [self.get_type(m) for m in ctype.members.values()]
+            self.types[id(ctype)] = (struct_type, ctype)
             if ctype.union:
-                largest_member = max(member_types, key=lambda m: m.get_abi_size(self.module.data_layout))
-                struct_type.set_body(largest_member)
+                # 与C的ABI一致：以对齐要求最高的成员（对齐相同时取较大者）为主体，再以字节数组补足到联合体的大小
+                members = ctype.members.values()
+                main_member = max(members, key=lambda m: self.get_layout(m)[::-1])
+                padding = ctype.layout.place(self.data_layout).size - self.get_layout(main_member)[0]
+                if padding:
+                    struct_type.set_body(self.get_type(main_member), ir.ArrayType(ir.IntType(8), padding))
+                else:
+                    struct_type.set_body(self.get_type(main_member))
             else:
-                struct_type.set_body(*member_types)
+                struct_type.set_body(*[self.get_type(m) for m in ctype.members.values()])
             return struct_type
         elif isinstance(ctype, EnumType):
             return ir.IntType(32)
@@ -100,9 +122,12 @@ class Generator(Interpreter):
             indices = [ir.Constant(ir.IntType(32), 0), arr_idx]
             return self.builder.gep(arr_addr, indices, inbounds=True)
         elif isinstance(node, MemberAccess):
-            obj_addr = self.get_address(node.object)
-            obj_idx = node.index
-            indices = [ir.Constant(ir.IntType(32), 0), ir.Constant(ir.IntType(32), obj_idx)]
+            obj_addr = self.visit(node.object) if node.arrow else self.get_address(node.object)
+            comp_type = node.object.ctype.type if node.arrow else node.object.ctype
+            if comp_type.union:
+                # 联合体的所有成员都位于偏移0处
+                return self.builder.bitcast(obj_addr, self.get_type(node.ctype).as_pointer())
+            indices = [ir.Constant(ir.IntType(32), 0), ir.Constant(ir.IntType(32), node.index)]
             return self.builder.gep(obj_addr, indices, inbounds=True)
         if isinstance(node, UnaryOp) and node.op == '*':
             return self.visit(node.operand)
@@ -126,7 +151,13 @@ class Generator(Interpreter):
         self.strings[node.value] = str_val
         return str_val
 
+    def get_constant(self, node):
+        # 常量折叠后的表达式直接生成常量，不再生成指令
+        return ir.Constant(self.get_type(node.ctype), node.const)
+
     def parse_constant(self, node):
+        if node.const is not None:
+            return self.get_constant(node)
         if isinstance(node, Integer):
             return ir.Constant(ir.IntType(32), int(node.value, 0))
         if isinstance(node, Decimal):
@@ -145,11 +176,34 @@ class Generator(Interpreter):
             return constants
         raise Exception
 
+    @staticmethod
+    def cast_constant(value, tgt_type):
+        # 在编译期完成数值常量的类型转换，语义与parse_cast生成的指令一致；无法转换时返回None
+        src_type = value.type
+        if isinstance(src_type, ir.IntType):
+            bits = src_type.width
+            src_val = int(value.constant) & ((1 << bits) - 1)
+            src_val = src_val - (1 << bits) if src_val >> (bits - 1) else src_val
+            if isinstance(tgt_type, ir.IntType):
+                return ir.Constant(tgt_type, wrap(src_val, tgt_type.width))
+            if isinstance(tgt_type, ir.FloatType):
+                return ir.Constant(tgt_type, to_float(src_val))
+        elif isinstance(src_type, ir.FloatType) and isinstance(tgt_type, ir.IntType):
+            src_val = value.constant
+            if math.isfinite(src_val) and wrap(int(src_val), tgt_type.width) == int(src_val):
+                return ir.Constant(tgt_type, int(src_val))
+        return None
+
     def parse_cast(self, value, tgt_type, signed=True):
         src_type = value.type
         if src_type == tgt_type:
             return value
-        elif isinstance(src_type, ir.FloatType) and isinstance(tgt_type, ir.IntType):
+        if signed and isinstance(value, ir.Constant) and not isinstance(value, ir.GlobalValue):
+            const_val = self.cast_constant(value, tgt_type) if value.constant is not None else None
+            if const_val is not None:
+                return const_val
+        # 无法在编译期转换的常量（如空指针、超出范围的浮点数）与变量一样生成转换指令
+        if isinstance(src_type, ir.FloatType) and isinstance(tgt_type, ir.IntType):
             return self.builder.fptosi(value, tgt_type) if signed else self.builder.fptoui(value, tgt_type)
         elif isinstance(src_type, ir.IntType) and isinstance(tgt_type, ir.FloatType):
             return self.builder.sitofp(value, tgt_type) if signed else self.builder.uitofp(value, tgt_type)
@@ -189,8 +243,10 @@ class Generator(Interpreter):
             return self.builder.trunc(res_val, ir.IntType(32))
 
         is_float = isinstance(left.type, ir.FloatType)
-        if op in ('+', '-'):
+        if op == '+':
             return self.builder.fadd(left, right) if is_float else self.builder.add(left, right)
+        if op == '-':
+            return self.builder.fsub(left, right) if is_float else self.builder.sub(left, right)
         if op == '*':
             return self.builder.fmul(left, right) if is_float else self.builder.mul(left, right)
         if op == '/':
@@ -306,6 +362,13 @@ class Generator(Interpreter):
                     const_val = self.parse_constant(decl.init)
                     if isinstance(const_val, list):
                         var_val.initializer = ir.Constant(var_type, const_val)
+                    elif isinstance(const_val, ir.Constant) and const_val.type != var_type:
+                        # 全局变量没有运行时的转换指令，超出目标类型范围的浮点常量只能报错
+                        casted_val = self.cast_constant(const_val, var_type)
+                        if casted_val is None:
+                            raise SemanticError(f"全局变量 '{var_name}' 的初始值无法转换为 '{decl.ctype}' 类型",
+                                                decl.init.line, decl.init.column)
+                        var_val.initializer = casted_val
                     else:
                         var_val.initializer = const_val
                 else:
@@ -325,10 +388,10 @@ class Generator(Interpreter):
 
     def statement(self, tree):
         for stmt in tree.stmts:
-            self.visit(stmt)
+            yield stmt
 
     def if_stmt(self, tree: IfStatement):
-        cond_val = self.visit(tree.cond)
+        cond_val = yield tree.cond
 
         if cond_val.type != ir.IntType(1):
             cond_val = self.builder.icmp_signed('!=', cond_val, ir.Constant(cond_val.type, 0))
@@ -336,12 +399,12 @@ class Generator(Interpreter):
         if tree.orelse:
             with self.builder.if_else(cond_val) as (then, orelse):
                 with then:
-                    self.visit(tree.then)
+                    yield tree.then
                 with orelse:
-                    self.visit(tree.orelse)
+                    yield tree.orelse
         else:
             with self.builder.if_then(cond_val):
-                self.visit(tree.then)
+                yield tree.then
 
     def while_stmt(self, tree):
         cond_block = self.curr_func.append_basic_block('while.cond')
@@ -352,13 +415,13 @@ class Generator(Interpreter):
         self.builder.branch(cond_block)
 
         self.builder.position_at_end(cond_block)
-        cond_val = self.visit(tree.cond)
+        cond_val = yield tree.cond
         if cond_val.type != ir.IntType(1):
             cond_val = self.builder.icmp_signed('!=', cond_val, ir.Constant(cond_val.type, 0))
         self.builder.cbranch(cond_val, loop_block, end_block)
 
         self.builder.position_at_end(loop_block)
-        self.visit(tree.body)
+        yield tree.body
         if not self.builder.block.is_terminated:
             self.builder.branch(cond_block)
 
@@ -373,12 +436,12 @@ class Generator(Interpreter):
 
         self.loop_stack.append((end_block, post_block))
         if tree.init:
-            self.visit(tree.init)
+            yield tree.init
         self.builder.branch(cond_block)
 
         self.builder.position_at_end(cond_block)
         if tree.cond:
-            cond_val = self.visit(tree.cond)
+            cond_val = yield tree.cond
             if cond_val.type != ir.IntType(1):
                 cond_val = self.builder.icmp_signed('!=', cond_val, ir.Constant(cond_val.type, 0))
             self.builder.cbranch(cond_val, loop_block, end_block)
@@ -386,13 +449,13 @@ class Generator(Interpreter):
             self.builder.branch(loop_block)
 
         self.builder.position_at_end(loop_block)
-        self.visit(tree.body)
+        yield tree.body
         if not self.builder.block.is_terminated:
             self.builder.branch(post_block)
 
         self.builder.position_at_end(post_block)
         if tree.post:
-            self.visit(tree.post)
+            yield tree.post
         if not self.builder.block.is_terminated:
             self.builder.branch(cond_block)
 
@@ -401,7 +464,7 @@ class Generator(Interpreter):
 
     def return_stmt(self, tree):
         if tree.expr:
-            return_val = self.visit(tree.expr)
+            return_val = yield tree.expr
             return_val = self.parse_cast(return_val, self.curr_func.return_value)
             self.builder.ret(return_val)
         else:
@@ -420,17 +483,17 @@ class Generator(Interpreter):
 
     def expr_stmt(self, tree):
         if tree.expr:
-            self.visit(tree.expr)
+            yield tree.expr
 
     def expression(self, tree: Expression):
         expr_val = None
         for expr in tree.exprs:
-            expr_val = self.visit(expr)
+            expr_val = yield expr
         return expr_val
 
     def assign_op(self, tree):
         left_addr = self.get_address(tree.left)
-        right_val = self.visit(tree.right)
+        right_val = yield tree.right
 
         if tree.op == '=':
             res_val = self.parse_cast(right_val, left_addr.type.pointee)
@@ -450,12 +513,14 @@ class Generator(Interpreter):
             return res_val
 
     def binary_op(self, tree):
+        if tree.const is not None:
+            return self.get_constant(tree)
         if tree.op in ('&&', '||'):
             is_and = (tree.op == '&&')
 
-            left_cond = self.visit(tree.left)
+            left_cond = yield tree.left
             if left_cond.type != ir.IntType(1):
-                left_cond = self.builder.icmp_ne(left_cond, ir.Constant(left_cond.type, 0))
+                left_cond = self.builder.icmp_signed('!=', left_cond, ir.Constant(left_cond.type, 0))
 
             res_addr = self.builder.alloca(ir.IntType(1), name='logic.res')
             self.builder.store(left_cond, res_addr)
@@ -465,21 +530,23 @@ class Generator(Interpreter):
             self.builder.cbranch(left_cond, next_block if is_and else end_block, end_block if is_and else next_block)
 
             self.builder.position_at_end(next_block)
-            right_cond = self.visit(tree.right)
+            right_cond = yield tree.right
             if right_cond.type != ir.IntType(1):
-                right_cond = self.builder.icmp_ne(right_cond, ir.Constant(right_cond.type, 0))
+                right_cond = self.builder.icmp_signed('!=', right_cond, ir.Constant(right_cond.type, 0))
             self.builder.store(right_cond, res_addr)
             self.builder.branch(end_block)
 
             self.builder.position_at_end(end_block)
             return self.builder.load(res_addr)
         else:
-            left_val = self.visit(tree.left)
-            right_val = self.visit(tree.right)
+            left_val = yield tree.left
+            right_val = yield tree.right
             return self.parse_binary(tree, left_val, right_val)
 
     def unary_op(self, tree):
-        old_val = self.visit(tree.operand)
+        if tree.const is not None:
+            return self.get_constant(tree)
+        old_val = yield tree.operand
         if tree.op == '+':
             return old_val
         elif tree.op == '-':
@@ -489,6 +556,8 @@ class Generator(Interpreter):
                 return self.builder.neg(old_val)
         elif tree.op == '!':
             zero = ir.Constant(old_val.type, 0)
+            if isinstance(old_val.type, ir.FloatType):
+                return self.builder.fcmp_ordered('==', old_val, zero)
             return self.builder.icmp_signed('==', old_val, zero)
         elif tree.op == '&':
             return self.get_address(tree.operand)
@@ -515,12 +584,12 @@ class Generator(Interpreter):
         func_name = tree.func.value
         if func_name in ("printf", "scanf"):
             func_val = self.module.globals.get(func_name)
-            format_str_val = self.visit(tree.args[0])
+            format_str_val = yield tree.args[0]
             arg_vals = [format_str_val]
 
             for arg_node in tree.args[1:]:
                 if func_name == 'printf':
-                    arg_val = self.visit(arg_node)
+                    arg_val = yield arg_node
                     if isinstance(arg_val.type, ir.FloatType):
                         arg_val = self.builder.fpext(arg_val, ir.DoubleType())
                     arg_vals.append(arg_val)
@@ -530,11 +599,11 @@ class Generator(Interpreter):
                     arg_vals.append(casted_addr)
             return self.builder.call(func_val, arg_vals)
         else:
-            func_val = self.visit(tree.func)
+            func_val = yield tree.func
             arg_vals = []
             for i, arg_node in enumerate(tree.args):
                 arg_type = func_val.type.pointee.args[i]
-                arg_val = self.visit(arg_node)
+                arg_val = yield arg_node
                 arg_val = self.parse_cast(arg_val, arg_type)
                 arg_vals.append(arg_val)
             return self.builder.call(func_val, arg_vals)
@@ -545,9 +614,6 @@ class Generator(Interpreter):
 
     def member_access(self, tree):
         member_addr = self.get_address(tree)
-        if isinstance(tree.object.ctype, CompoundType) and tree.object.ctype.union:
-            target_ptr_type = self.get_type(tree.ctype).as_pointer()
-            member_addr = self.builder.bitcast(member_addr, target_ptr_type)
         return self.builder.load(member_addr)
 
     def identifier(self, tree):
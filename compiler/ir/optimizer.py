@@ -1,32 +1,61 @@
 from pathlib import Path
 
+import llvmlite
 from llvmlite import binding
+from llvmlite.binding import ffi
+from llvmlite.binding.newpassmanagers import ModulePassManager
 
+from compiler.ir.options import OPT_LEVELS, PASSES
+from compiler.ir.target import create_target_machine, thread_context
 from compiler.utils import write_file
 
+# llvmlite 0.44的C++端将-Os对应到速度级别1，按文档传入速度级别2会触发UNREACHABLE
+# 仅在该版本上绕过Python接口的检查直接构建流水线（requirements.txt固定了此版本），其他版本按文档使用公开接口
+OS_PIPELINE_WORKAROUND = llvmlite.__version__.split('.')[:2] == ['0', '44']
+
 
 class Optimizer:
-    def __init__(self, opt_level=2, size_level=0):
+    def __init__(self, opt_level=2, size_level=0, target_machine=None, pipeline=None):
         self.opt_level = opt_level
         self.size_level = size_level
-
-        self.pmb = binding.PassManagerBuilder()
-        self.pmb.opt_level = self.opt_level
-        self.pmb.size_level = self.size_level
-
-        self.ir = None
-
-    def optimize(self, ir):
-        module = binding.parse_assembly(str(ir))
-        pm = binding.ModulePassManager()
-        self.pmb.populate(pm)
-
-        pm.add_dead_code_elimination_pass()
-        pm.add_function_inlining_pass(self.opt_level)
-
-        pm.run(module)
-        self.ir = str(module)
-        return self.ir
+        self.target_machine = target_machine or create_target_machine()
+        self.pipeline = pipeline.split(',') if isinstance(pipeline, str) else pipeline
+        for name in self.pipeline or []:
+            if name not in PASSES:
+                raise ValueError(f"未知的优化遍 '{name}'，可用的遍有: {', '.join(PASSES)}")
+
+        # 向量化的开关与clang相同：-O2及以上启用，-Oz不做循环向量化，-Os/-Oz不做SLP向量化
+        self.pto = binding.create_pipeline_tuning_options(speed_level=opt_level, size_level=size_level)
+        self.pto.loop_vectorization = opt_level >= 2 and size_level < 2
+        self.pto.slp_vectorization = opt_level >= 2 and size_level == 0
+
+        self.pass_builder = None
+        self.module = None
+
+    def optimize(self, module):
+        # 在内存中的模块上原地优化，仅为兼容仍接受文本形式的IR
+        if not isinstance(module, binding.ModuleRef):
+            module = binding.parse_assembly(str(module), context=thread_context())
+
+        # 遍的计时插桩在创建PassBuilder时注册，每次优化时重新创建，使set_time_passes对其生效
+        # PassBuilder销毁时会打印尚未取走的计时结果，因此保留到下一次优化
+        self.pass_builder = pass_builder = binding.create_pass_builder(self.target_machine, self.pto)
+        if self.pipeline is not None:
+            pm = binding.create_new_module_pass_manager()
+            for name in self.pipeline:
+                getattr(pm, PASSES[name])()
+            pm.run(module, pass_builder)
+        elif self.opt_level > 0:
+            # -O0时跳过优化，直接进入代码生成
+            self.default_pipeline(pass_builder).run(module, pass_builder)
+
+        self.module = module
+        return self.module
+
+    def default_pipeline(self, pass_builder):
+        if self.size_level == 1 and OS_PIPELINE_WORKAROUND:
+            return ModulePassManager(ffi.lib.LLVMPY_buildPerModuleDefaultPipeline(pass_builder, 1, 1))
+        return pass_builder.getModulePassManager()
 
     def save(self, file_path=''):
-        write_file(self.ir, Path(file_path) / '04 opt_ir.txt')
+        write_file(str(self.module), Path(file_path) / '04 opt_ir.txt')
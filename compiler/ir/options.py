@@ -0,0 +1,13 @@
+# 优化级别对应的(速度级别, 体积级别)，与clang的-O0/-O1/-O2/-O3/-Os/-Oz一致
+OPT_LEVELS = {'0': (0, 0), '1': (1, 0), '2': (2, 0), '3': (3, 0), 's': (2, 1), 'z': (2, 2)}
+
+# 自定义流水线中可用的遍，名称与LLVM opt的-passes参数一致
+PASSES = {
+    'instcombine': 'add_instruction_combine_pass',
+    'simplifycfg': 'add_simplify_cfg_pass',
+    'jump-threading': 'add_jump_threading_pass',
+    'loop-rotate': 'add_loop_rotate_pass',
+    'loop-unroll': 'add_loop_unroll_pass',
+    'aa-eval': 'add_aa_eval_pass',
+    'verify': 'add_verifier',
+}
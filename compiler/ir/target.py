@@ -0,0 +1,48 @@
+import functools
+import threading
+
+from llvmlite import binding
+
+
+@functools.cache
+def initialize():
+    # 仅在第一次用到LLVM时初始化，只做语法检查等不经过后端的编译不承担这部分开销
+    binding.initialize()
+    binding.initialize_native_target()
+    binding.initialize_native_asmprinter()
+
+
+@functools.cache
+def resolve_target(triple=None, cpu=None, features=None):
+    # 默认以宿主机为目标并启用宿主CPU的全部特性；指定其他目标三元组时默认使用通用CPU
+    initialize()
+    native = triple is None
+    triple = binding.get_default_triple() if native else triple
+    if cpu is None:
+        cpu = binding.get_host_cpu_name() if native else ''
+    if features is None:
+        features = binding.get_host_cpu_features().flatten() if native else ''
+    return triple, cpu, features
+
+
+@functools.cache
+def create_target_machine(triple=None, cpu=None, features=None, opt=2):
+    # 同一目标机器贯穿IR生成（数据布局）、优化与代码生成，结果按参数缓存
+    triple, cpu, features = resolve_target(triple, cpu, features)
+    target = binding.Target.from_triple(triple)
+    # 可执行文件由clang链接为位置无关代码，目标文件须以pic重定位模式生成
+    return target.create_target_machine(cpu=cpu, features=features, opt=opt, reloc='pic', codemodel='default')
+
+
+# LLVM上下文不是线程安全的，每个线程使用各自的上下文，多个线程可以同时生成与优化
+# 模块可能在其他线程中继续使用，且须先于上下文释放，因此上下文在进程内一直保留
+CONTEXTS = {}
+
+
+def thread_context():
+    ident = threading.get_ident()
+    context = CONTEXTS.get(ident)
+    if context is None:
+        initialize()
+        context = CONTEXTS[ident] = binding.create_context()
+    return context
@@ -1,28 +1,44 @@
 from pathlib import Path
 
-from lark import Lark, UnexpectedCharacters
-from tabulate import tabulate
+from lark import UnexpectedCharacters
 
 from compiler.error import LexicalError
-from compiler.utils import read_file, write_file
+from compiler.utils import CACHE_DIR, load_lark, write_file
+from .scanner import Scanner
 
 
 class Lexer:
-    def __init__(self, file_path='lexicon.lark'):
+    def __init__(self, file_path='lexicon.lark', cache_dir=CACHE_DIR, engine='lark'):
         self.file_path = Path(__file__).parent / file_path
-        self.lexicon = read_file(self.file_path)
-        self.lexer = Lark(self.lexicon, lexer='basic')
+        self.engine = engine
+        if engine == 'lark':
+            self.lexer = load_lark(self.file_path, cache_dir, parser='lalr', lexer='basic')
+        elif engine == 'regex':
+            self.lexer = Scanner()
+        else:
+            raise ValueError(f"未知的词法分析引擎 '{engine}'")
+        self.code = None
         self.tokens = None
 
-    def lex(self, code):
+    def lex(self, code, stream=False):
+        self.code = code
+        self.tokens = None
+        tokens = self.scan(code)
+        if stream:
+            return tokens
+        self.tokens = list(tokens)
+        return self.tokens
+
+    def scan(self, code):
         try:
-            self.tokens = list(self.lexer.lex(code))
+            yield from self.lexer.lex(code)
         except UnexpectedCharacters as e:
             raise LexicalError('无法识别的字符', e.line, e.column)
-        return self.tokens
 
     @staticmethod
     def tabular(tokens):
+        # 仅在导出时用到
+        from tabulate import tabulate
         rows = []
         for token in tokens:
             rows.append([token.type, token.value, token.line, token.column])
@@ -30,4 +46,6 @@ class Lexer:
         return table
 
     def save(self, file_path=''):
+        if self.tokens is None:
+            self.tokens = list(self.scan(self.code))
         write_file(self.tabular(self.tokens), Path(file_path) / '01 tokens.txt')
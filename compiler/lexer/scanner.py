@@ -0,0 +1,71 @@
+import re
+
+from lark import Token
+
+from compiler.error import LexicalError
+
+# 关键字：先按IDENT匹配，再查表确定类型
+KEYWORDS = {
+    'void': 'VOID', 'int': 'INT', 'float': 'FLOAT', 'char': 'CHAR', 'bool': 'BOOL',
+    'struct': 'STRUCT', 'union': 'UNION', 'enum': 'ENUM',
+    'if': 'IF', 'else': 'ELSE', 'for': 'FOR', 'while': 'WHILE',
+    'break': 'BREAK', 'continue': 'CONTINUE', 'return': 'RETURN',
+    'nullptr': 'NULLPTR', 'true': 'TRUE', 'false': 'FALSE',
+}
+
+# 运算符与分隔符：统一按OP匹配（长者优先），再查表确定类型
+OPERATORS = {
+    '->': 'ARROW', '--': 'DECREMENT', '==': 'EQ', '>=': 'GE', '++': 'INCREMENT',
+    '&&': 'LAND', '<=': 'LE', '||': 'LOR', '-=': 'MINUSASSIGN', '%=': 'MODASSIGN',
+    '!=': 'NE', '+=': 'PLUSASSIGN', '/=': 'SLASHASSIGN', '*=': 'STARASSIGN',
+    '=': 'ASSIGN', '&': 'BAND', ',': 'COMMA', '.': 'DOT', '>': 'GT', '{': 'LBRACE',
+    '[': 'LBRACK', '!': 'LNOT', '(': 'LPAREN', '<': 'LT', '-': 'MINUS', '%': 'MOD',
+    '+': 'PLUS', '}': 'RBRACE', ']': 'RBRACK', ')': 'RPAREN', ';': 'SEMICOLON',
+    '/': 'SLASH', '*': 'STAR',
+}
+
+# 与lexicon.lark一致，顺序与Lark基础词法分析器的终结符优先顺序一致
+TERMINALS = [
+    ('DECIMAL', r'(?:(?:\d+\.\d*|\.\d+|\d+\.)(?:[eE][+-]?\d+)?|\d+(?:[eE][+-]?\d+))'),
+    ('INTEGER', r'(?:0|[1-9][0-9]*)|0[xX][0-9a-fA-F]+|0[oO][0-7]+|0[bB][01]+'),
+    ('TYPE', r'(?=[A-Z0-9]*[a-z])[A-Z][a-z0-9]*(?:[A-Z][a-z0-9]*)*'),
+    ('COMMENT', r'/\*[\s\S]*?\*/|//[^\n]*'),
+    ('IDENT', r'[a-z][a-z0-9]*(?:_[a-z0-9]+)*'),
+    ('IMM', r'[A-Z][A-Z0-9]*(?:_[A-Z0-9]+)*'),
+    ('STRING', r'"(?:[^"\\]|\\.)*"'),
+    ('WS', r'[ \t\f\r\n]+'),
+    ('CHARACTER', r"'(?:[^\\'\n]|\\.)'"),
+    ('OP', '|'.join(re.escape(op) for op in sorted(OPERATORS, key=len, reverse=True))),
+]
+
+NEWLINE_TYPES = frozenset({'WS', 'COMMENT', 'STRING', 'CHARACTER'})
+IGNORE_TYPES = frozenset({'WS', 'COMMENT'})
+
+
+class Scanner:
+    def __init__(self):
+        self.regex = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in TERMINALS))
+
+    def lex(self, code):
+        match = self.regex.match
+        pos, line, line_start, end = 0, 1, 0, len(code)
+        while pos < end:
+            m = match(code, pos)
+            if m is None:
+                raise LexicalError('无法识别的字符', line, pos - line_start + 1)
+
+            type, value, next_pos = m.lastgroup, m.group(), m.end()
+            if type == 'OP':
+                type = OPERATORS[value]
+            elif type == 'IDENT':
+                type = KEYWORDS.get(value, 'IDENT')
+
+            start_line, column = line, pos - line_start + 1
+            if type in NEWLINE_TYPES:
+                newlines = value.count('\n')
+                if newlines:
+                    line += newlines
+                    line_start = pos + value.rindex('\n') + 1
+            if type not in IGNORE_TYPES:
+                yield Token(type, value, pos, start_line, column, line, next_pos - line_start + 1, next_pos)
+            pos = next_pos
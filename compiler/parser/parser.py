@@ -1,43 +1,98 @@
 from pathlib import Path
 
-from lark import Lark, UnexpectedToken
-from tabulate import tabulate
+from lark import UnexpectedCharacters, UnexpectedToken
 
-from compiler.error import SyntaxError
-from compiler.tree import ASTTransformer
-from compiler.utils import read_file, write_file
+from compiler.error import LexicalError, SyntaxError
+from compiler.lexer.scanner import KEYWORDS
+from compiler.tree import ASTTransformer, InlineASTTransformer
+from compiler.utils import CACHE_DIR, load_lark, write_file
+
+
+LEXICON_PATH = Path(__file__).parent.parent / 'lexer'
+
+
+def retype_keyword(token):
+    # 上下文词法分析器只尝试当前状态可接受的终结符，关键字可能被识别为IDENT，这里统一改回关键字
+    token.type = KEYWORDS.get(token.value, token.type)
+    return token
 
 
 class Parser:
-    def __init__(self, file_path='syntax.lark'):
+    def __init__(self, file_path='syntax.lark', cache_dir=CACHE_DIR, inline=False, fused=False):
         self.file_path = Path(__file__).parent / file_path
-        self.syntax = read_file(self.file_path)
-        self.parser = Lark(self.syntax, parser='lalr', propagate_positions=True)
+        self.cache_dir = cache_dir
+        self.inline = inline or fused
+        self.fused = fused
+        self.parser = None
+        self.inline_parser = None
+        self.transformer = None
+        if fused:
+            self.transformer = InlineASTTransformer()
+            self.inline_parser = self.load(transformer=self.transformer, lexer_callbacks={'IDENT': retype_keyword})
+        elif inline:
+            self.transformer = InlineASTTransformer()
+            self.inline_parser = self.load(transformer=self.transformer)
+        else:
+            self.parser = self.load(propagate_positions=True)
         self.cst = None
         self.ast = None
 
-    def parse(self, tokens):
-        ip = self.parser.parse_interactive()
+    def load(self, **options):
+        return load_lark(self.file_path, self.cache_dir, parser='lalr', lexer='contextual',
+                         import_paths=[str(LEXICON_PATH)], **options)
+
+    @staticmethod
+    def feed(parser, tokens):
+        ip = parser.parse_interactive()
 
+        token = None
         try:
             for token in tokens:
                 ip.feed_token(token)
-            self.cst = ip.feed_eof(tokens[-1])
+            return ip.feed_eof(token)
+        except UnexpectedToken as e:
+            raise SyntaxError('无法识别的单词', e.line, e.column)
+
+    def parse_text(self, code):
+        self.cst = None
+        self.transformer.reset()
+        try:
+            self.ast = self.inline_parser.parse(code)
+        except UnexpectedCharacters as e:
+            raise LexicalError('无法识别的字符', e.line, e.column)
         except UnexpectedToken as e:
             raise SyntaxError('无法识别的单词', e.line, e.column)
+        finally:
+            self.transformer.reset()
+        return self.ast
 
-        transformer = ASTTransformer()
-        self.ast = transformer.transform(self.cst)
+    def parse(self, tokens):
+        self.cst = None
+        if self.inline:
+            self.transformer.reset()
+            self.ast = self.feed(self.inline_parser, tokens)
+            self.transformer.reset()
+        else:
+            self.cst = self.feed(self.parser, tokens)
+            self.ast = ASTTransformer().transform(self.cst)
         return self.ast
 
+    def parse_cst(self, tokens):
+        if self.parser is None:
+            self.parser = self.load(propagate_positions=True)
+        self.cst = self.feed(self.parser, tokens)
+        return self.cst
+
     @property
     def table(self):
-        inner_parser = self.parser.parser.parser
+        inner_parser = (self.parser or self.inline_parser).parser.parser
         inner_table = getattr(inner_parser, '_parse_table', None)
         return inner_table
 
     @staticmethod
     def tabular(table):
+        # 仅在导出时用到
+        from tabulate import tabulate
         action_rows = []
         for state, actions in table.states.items():
             for token, (action, arg) in actions.items():
@@ -64,10 +119,14 @@ class Parser:
                               stralign="center")
         return action_table, goto_table
 
-    def save(self, file_path=''):
+    def save(self, file_path='', tokens=None):
         action_table, goto_table = self.tabular(self.table)
         write_file(action_table, Path(file_path) / '02 action_table.txt')
         write_file(goto_table, Path(file_path) / '02 goto_table.txt')
 
-        write_file(self.cst.pretty(), Path(file_path) / '03 cst.txt')
+        # 内联模式下仅在需要导出时才构建CST
+        if self.cst is None and tokens is not None:
+            self.parse_cst(tokens)
+        if self.cst is not None:
+            write_file(self.cst.pretty(), Path(file_path) / '03 cst.txt')
         write_file(self.ast.pretty(), Path(file_path) / '03 ast.txt')
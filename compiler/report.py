@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from compiler.utils import write_file
+
+# LLVM计时报告中的一行：若干列“耗时 (占比)”，最后一列为墙钟时间，其后是遍的名称
+PASS_LINE = re.compile(r'^\s*((?:[\d.]+ \(\s*[\d.]+%\)\s+)+)(.+?)\s*$')
+# 计时报告的其余部分：分隔线、标题、表头、总计与空行
+REPORT_LINE = re.compile(r'^\s*(?:=+-+=+|\.\.\. .* \.\.\.|Total Execution Time: .*|.*--- Name ---|)\s*$')
+
+# 计时开关与文件描述符2都是进程级的，多个线程同时编译时LLVM阶段须依次计时
+LLVM_TIMING_LOCK = threading.Lock()
+
+
+class PeakMemory:
+    # 阶段内进程的常驻内存峰值（MiB）：Linux下阶段开始时经/proc/self/clear_refs把峰值重置为当前值，结束时读取VmHWM
+    # 峰值是进程级的，有其他阶段正在计时时不重置，以免截断它们的统计；不能重置峰值的平台不统计
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.supported = True
+
+    def start(self):
+        with self.lock:
+            if self.active == 0 and self.supported:
+                try:
+                    with open('/proc/self/clear_refs', 'w') as f:
+                        f.write('5')
+                except OSError:
+                    self.supported = False
+            self.active += 1
+
+    def stop(self):
+        peak = None
+        if self.supported:
+            try:
+                with open('/proc/self/status') as f:
+                    peak = next(int(line.split()[1]) / 2 ** 10 for line in f if line.startswith('VmHWM:'))
+            except (OSError, StopIteration):
+                pass
+        with self.lock:
+            self.active -= 1
+        return peak
+
+
+PEAK_MEMORY = PeakMemory()
+
+
+class TimeReport:
+    # 记录编译各阶段的墙钟时间、CPU时间与内存峰值，以及LLVM各优化遍的耗时
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.stages = []
+        self.passes = []
+
+    @contextmanager
+    def stage(self, name, llvm=False):
+        if not self.enabled:
+            yield
+            return
+        if llvm:
+            from llvmlite import binding
+            LLVM_TIMING_LOCK.acquire()
+            # 新遍管理器在运行结束时直接把计时结果写到标准错误（文件描述符2），须在文件描述符层面捕获
+            sys.stderr.flush()
+            stderr, captured = os.dup(2), tempfile.TemporaryFile()
+            os.dup2(captured.fileno(), 2)
+            binding.set_time_passes(True)
+        PEAK_MEMORY.start()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'name': name,
+                'start': wall - self.origin,
+                'wall': time.perf_counter() - wall,
+                'cpu': time.process_time() - cpu,
+                'memory': PEAK_MEMORY.stop(),
+            })
+            if llvm:
+                # 旧遍管理器（代码生成）的计时结果需主动取出
+                report = binding.report_and_reset_timings()
+                binding.set_time_passes(False)
+                os.dup2(stderr, 2)
+                os.close(stderr)
+                LLVM_TIMING_LOCK.release()
+                captured.seek(0)
+                output = captured.read().decode('utf-8', errors='replace')
+                captured.close()
+                # 捕获期间整个进程的标准错误都被重定向，计时报告以外的内容（LLVM的警告、错误信息与其他线程的输出）原样写回
+                kept = ''.join(line for line in output.splitlines(keepends=True)
+                               if not PASS_LINE.match(line) and not REPORT_LINE.match(line))
+                if kept:
+                    with open(2, 'wb', closefd=False) as f:
+                        f.write(kept.encode('utf-8'))
+                self.parse_passes(name, output + report)
+
+    def parse_passes(self, stage, report):
+        for line in report.splitlines():
+            match = PASS_LINE.match(line)
+            if match and match.group(2) != 'Total':
+                wall = float(match.group(1).split('(')[-2].split()[-1])
+                self.passes.append({'stage': stage, 'name': match.group(2), 'wall': wall})
+
+    # ===============  输 出  ===============
+
+    def table(self, limit=10):
+        total = sum(stage['wall'] for stage in self.stages) or 1
+        lines = [f"{'stage':<14}{'wall(ms)':>12}{'cpu(ms)':>12}{'%':>9}{'peak(MiB)':>16}"]
+        for stage in self.stages:
+            memory = f"{stage['memory']:.1f}" if stage['memory'] is not None else '-'
+            lines.append(f"{stage['name']:<14}{stage['wall'] * 1000:>12.2f}{stage['cpu'] * 1000:>12.2f}"
+                         f"{stage['wall'] / total:>9.1%}{memory:>16}")
+        lines.append(f"{'total':<14}{total * 1000:>12.2f}")
+
+        if self.passes:
+            lines.append('')
+            lines.append(f"{'llvm pass':<42}{'wall(ms)':>12}")
+            for item in sorted(self.passes, key=lambda item: item['wall'], reverse=True)[:limit]:
+                lines.append(f"{item['name']:<42}{item['wall'] * 1000:>12.2f}")
+        return '\n'.join(lines)
+
+    def trace(self):
+        # Chrome trace-event格式，可在chrome://tracing或Perfetto中以火焰图查看
+        # LLVM只提供各遍的累计耗时且遍之间存在嵌套，单独成一条轨道，从所属阶段的开始处按耗时依次排布
+        events = []
+        for stage in self.stages:
+            events.append({
+                'name': stage['name'], 'cat': 'stage', 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                'ts': stage['start'] * 1e6, 'dur': stage['wall'] * 1e6,
+                'args': {'cpu_ms': stage['cpu'] * 1000, 'peak_mib': stage['memory']},
+            })
+            offset = stage['start']
+            for item in sorted((i for i in self.passes if i['stage'] == stage['name']),
+                               key=lambda item: item['wall'], reverse=True):
+                events.append({
+                    'name': item['name'], 'cat': 'llvm', 'ph': 'X', 'pid': os.getpid(), 'tid': 1,
+                    'ts': offset * 1e6, 'dur': item['wall'] * 1e6,
+                })
+                offset += item['wall']
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, file_path=''):
+        write_file(json.dumps(self.trace(), ensure_ascii=False, indent=1), Path(file_path) / 'time_report.json')
@@ -1 +1,3 @@
-from .analyzer import Analyzer
\ No newline at end of file
+from .analyzer import Analyzer
+from .folder import Folder
+from .pruner import Pruner
@@ -1,15 +1,15 @@
-from lark.visitors import Interpreter
-
 from compiler.error import SemanticError
 from compiler.tree import *
+from .folder import Folder
 from .symbol import Symbol, SymbolKind, SymbolTable
 from .type import *
 
 
-class Analyzer(Interpreter):
+class Analyzer(Visitor):
     def __init__(self):
         super().__init__()
         self.table = SymbolTable()
+        self.folder = Folder()
         self.curr_func = None
         self.loop_depth = 0
 
@@ -17,8 +17,8 @@ class Analyzer(Interpreter):
             symbol = Symbol(type, name, SymbolKind.TYPE)
             self.table.define(symbol)
 
-        self.table.define(Symbol(FunctionType(INT, None), 'printf', SymbolKind.FUNC))
-        self.table.define(Symbol(FunctionType(INT, None), 'scanf', SymbolKind.FUNC))
+        self.table.define(Symbol(function_type(INT, None), 'printf', SymbolKind.FUNC))
+        self.table.define(Symbol(function_type(INT, None), 'scanf', SymbolKind.FUNC))
 
     # ===============  基础方法  ===============
 
@@ -42,7 +42,7 @@ class Analyzer(Interpreter):
         if not decl:
             return type
         if decl.pointer:
-            type = PointerType(type)
+            type = pointer_type(type)
         for suffix in reversed(decl.suffix):
             if isinstance(suffix, ArraySuffix):
                 size = None
@@ -54,63 +54,14 @@ class Analyzer(Interpreter):
                             self.raise_error("数组大小必须是常量表达式", suffix.size)
                     else:
                         self.raise_error("数组大小必须是 'int' 类型", suffix.size)
-                type = ArrayType(type, size)
+                type = array_type(type, size)
         return type
 
 
     def parse_constexpr(self, node):
-        if isinstance(node, Integer):
-            return int(node.value, 0)
-        if isinstance(node, Identifier):
-            symbol = self.table.lookup(node.value)
-            if symbol and isinstance(symbol.type, EnumType):
-                return symbol.type.enumerators[symbol.name]
-        if isinstance(node, BinaryOp):
-            left = self.parse_constexpr(node.left)
-            right = self.parse_constexpr(node.right)
-            if left is None or right is None:
-                return None
-            if node.op == '+':
-                return left + right
-            if node.op == '-':
-                return left - right
-            if node.op == '*':
-                return left * right
-            if node.op == '/':
-                if right == 0:
-                    self.raise_error("常量表达式中不能除以0", node.right)
-                return left // right
-            if node.op == '%':
-                if right == 0:
-                    self.raise_error("常量表达式中不能对0取模", node.right)
-                return left % right
-            if node.op == '==':
-                return int(left == right)
-            if node.op == '!=':
-                return int(left != right)
-            if node.op == '<':
-                return int(left < right)
-            if node.op == '>':
-                return int(left > right)
-            if node.op == '<=':
-                return int(left <= right)
-            if node.op == '>=':
-                return int(left >= right)
-            if node.op == '&&':
-                return int(bool(left) and bool(right))
-            if node.op == '||':
-                return int(bool(left) or bool(right))
-        if isinstance(node, UnaryOp):
-            operand = self.parse_constexpr(node.operand)
-            if operand is None:
-                return None
-            if node.op == '+':
-                return operand
-            if node.op == '-':
-                return -operand
-            if node.op == '!':
-                return int(not operand)
-        return None
+        # 对已分析的子树做常量折叠，数组大小与枚举值只接受整数
+        value = self.folder.fold(node).const
+        return int(value) if isinstance(value, int) else None
 
 
     def parse_init(self, node, type, context):
@@ -119,16 +70,16 @@ class Analyzer(Interpreter):
                 msg = f"数组 '{context.name.value}' 的初始化项长度 '{len(node.inits)}' 超出数组大小 '{type.size}'"
                 self.raise_error(msg, context)
             elif type.size is None:
-                type.size = len(node.inits)
+                type = array_type(type.type, len(node.inits))
 
-            type = type.type
+            elem_type = type.type
             for init in node.inits:
                 if isinstance(init, Initializer):
-                    self.parse_init(init, type, context)
+                    self.parse_init(init, elem_type, context)
                 else:
                     self.visit(init)
-                    if not self.is_assignable(type, init.ctype):
-                        self.raise_error(f"无法将 '{init.ctype}' 初始化为 '{type}'", init)
+                    if not self.is_assignable(elem_type, init.ctype):
+                        self.raise_error(f"无法将 '{init.ctype}' 初始化为 '{elem_type}'", init)
         elif isinstance(type, CompoundType):
             types = list(type.members.values())
 
@@ -144,6 +95,7 @@ class Analyzer(Interpreter):
                         self.raise_error(f"无法将 '{init.ctype}' 初始化为 '{member_type}'", init)
         else:
             self.raise_error(f"初始化列表不能用于类型 '{type}'", node)
+        return type
 
 
     @staticmethod
@@ -226,7 +178,7 @@ class Analyzer(Interpreter):
                 param_types.append(param_type)
                 param_names.append((param_type, param_name, param))
 
-        func_type = FunctionType(return_type, param_types)
+        func_type = function_type(return_type, param_types)
         symbol = self.table.lookup(func_name)
         if symbol:
             if symbol.defined:
@@ -261,8 +213,8 @@ class Analyzer(Interpreter):
         comp_name = tree.decl.name.value
         is_union = False if tree.spec.type == 'struct' else True
 
-        temp_type = CompoundType(comp_name, None, is_union)
-        symbol = Symbol(temp_type, comp_name, SymbolKind.TYPE, tree.decl.name, defined=False)
+        comp_type = CompoundType(comp_name, None, is_union)
+        symbol = Symbol(comp_type, comp_name, SymbolKind.TYPE, tree.decl.name, defined=False)
         if not self.table.define(symbol):
             self.raise_error(f"类型 '{comp_name}' 重复定义", tree.decl.name)
 
@@ -273,11 +225,13 @@ class Analyzer(Interpreter):
                 if member_name in members:
                     self.raise_error(f"成员变量 '{member_name}' 重复定义", member_decl)
                 member_type = self.parse_type(member.spec, member_decl)
+                if not is_complete(member_type):
+                    self.raise_error(f"成员变量 '{member_name}' 的类型 '{member_type}' 不完整", member_decl)
                 members[member_name] = member_type
                 member_decl.ctype = member_type
 
-        comp_type = CompoundType(comp_name, members, is_union)
-        symbol.type = comp_type
+        # 补全先行声明的类型，使成员中指向自身的指针类型引用同一对象
+        comp_type.complete(members)
         symbol.defined = True
 
     def enum_def(self, tree):
@@ -328,7 +282,7 @@ class Analyzer(Interpreter):
                     if param_type:
                         params_types.append(param_type)
 
-            func_type = FunctionType(return_type, params_types)
+            func_type = function_type(return_type, params_types)
             symbol = self.table.lookup(func_name)
             if symbol:
                 if symbol.type != func_type:
@@ -359,7 +313,7 @@ class Analyzer(Interpreter):
                 self.visit(var_init)
                 if isinstance(var_init, Initializer):
                     self.parse_init(var_init, var_type, decl)
-                elif self.curr_func is None and self.parse_constexpr(var_init) is None:
+                elif self.curr_func is None and self.folder.fold(var_init).const is None:
                     self.raise_error(f"全局变量 '{var_name}' 的初始化项必须是常量表达式", var_init)
                 elif not self.is_assignable(var_type, var_init.ctype):
                     self.raise_error(f"无法将 '{var_init.ctype}' 初始化为 '{var_type}'", var_init)
@@ -386,7 +340,9 @@ class Analyzer(Interpreter):
             if arr_init:
                 self.visit(arr_init)
                 if isinstance(arr_init, Initializer):
-                    self.parse_init(arr_init, arr_type, decl)
+                    # 未指定长度的数组由初始化列表确定长度
+                    arr_type = self.parse_init(arr_init, arr_type, decl)
+                    decl.ctype = symbol.type = arr_type
                 elif not self.is_assignable(arr_type, arr_init.ctype):
                     self.raise_error(f"无法将 '{arr_init.ctype}' 初始化为 '{arr_type}'", arr_init)
 
@@ -394,43 +350,43 @@ class Analyzer(Interpreter):
     def statement(self, tree):
         self.table.enter_scope()
         for stmt in tree.stmts:
-            self.visit(stmt)
+            yield stmt
         self.table.leave_scope()
 
     def if_stmt(self, tree):
-        self.visit(tree.cond)
+        yield tree.cond
         if not self.is_assignable(BOOL, tree.cond.ctype):
             self.raise_error("条件表达式的类型必须能转换为布尔型", tree.cond)
-        self.visit(tree.then)
+        yield tree.then
         if tree.orelse:
-            self.visit(tree.orelse)
+            yield tree.orelse
 
     def while_stmt(self, tree):
         self.loop_depth += 1
-        self.visit(tree.cond)
+        yield tree.cond
         if not self.is_assignable(BOOL, tree.cond.ctype):
             self.raise_error("条件表达式的类型必须能转换为布尔型", tree.cond)
-        self.visit(tree.body)
+        yield tree.body
         self.loop_depth -= 1
 
     def for_stmt(self, tree):
         self.table.enter_scope()
         self.loop_depth += 1
         if tree.init:
-            self.visit(tree.init)
+            yield tree.init
         if tree.cond:
-            self.visit(tree.cond)
+            yield tree.cond
             if not self.is_assignable(BOOL, tree.cond.ctype):
                 self.raise_error("条件表达式的类型必须能转换为布尔型", tree.cond)
         if tree.post:
-            self.visit(tree.post)
-        self.visit(tree.body)
+            yield tree.post
+        yield tree.body
         self.loop_depth -= 1
         self.table.leave_scope()
 
     def return_stmt(self, tree):
         if tree.expr:
-            self.visit(tree.expr)
+            yield tree.expr
 
         if not self.curr_func:
             self.raise_error("'return' 语句只能出现在函数内部", tree)
@@ -458,18 +414,18 @@ class Analyzer(Interpreter):
 
     def expr_stmt(self, tree):
         if tree.expr:
-            self.visit(tree.expr)
+            yield tree.expr
 
     def expression(self, tree):
         for expr in tree.exprs:
-            self.visit(expr)
+            yield expr
         if tree.exprs:
             tree.ctype = tree.exprs[-1].ctype
 
 
     def assign_op(self, tree):
-        self.visit(tree.left)
-        self.visit(tree.right)
+        yield tree.left
+        yield tree.right
         if not self.is_lvalue(tree.left):
             self.raise_error("表达式无法赋值", tree.left)
             return
@@ -488,8 +444,8 @@ class Analyzer(Interpreter):
             tree.ctype = ltype
 
     def binary_op(self, tree):
-        self.visit(tree.left)
-        self.visit(tree.right)
+        yield tree.left
+        yield tree.right
         ctype = self.parse_op(tree.op, tree.left.ctype, tree.right.ctype)
         if ctype is None:
             self.raise_error(f"运算符 '{tree.op}' 无效", tree)
@@ -498,7 +454,7 @@ class Analyzer(Interpreter):
 
 
     def unary_op(self, tree):
-        self.visit(tree.operand)
+        yield tree.operand
         ctype, op = tree.operand.ctype, tree.op
         if op in ('+', '-'):
             if ctype in (INT, FLOAT):
@@ -519,7 +475,7 @@ class Analyzer(Interpreter):
                 self.raise_error(f"运算符 '{op}' 只能用于指针或数组类型而非 '{ctype}'", tree.operand)
         elif op == '&':
             if self.is_lvalue(tree.operand):
-                tree.ctype = PointerType(ctype)
+                tree.ctype = pointer_type(ctype)
             else:
                 self.raise_error(f"运算符 '{op}' 只能用于可修改的左值", tree.operand)
         elif op in ('++', '--'):
@@ -529,7 +485,7 @@ class Analyzer(Interpreter):
                 self.raise_error(f"运算符 '{op}' 的操作数必须是可修改的值或指针左值", tree.operand)
 
     def postfix_op(self, tree):
-        self.visit(tree.operand)
+        yield tree.operand
         ctype = tree.operand.ctype
         if self.is_lvalue(tree.operand) and (ctype in (INT, FLOAT) or isinstance(ctype, PointerType)):
             tree.ctype = ctype
@@ -537,9 +493,9 @@ class Analyzer(Interpreter):
             self.raise_error(f"运算符 '{tree.op}' 的操作数必须是可修改的值或指针左值", tree.operand)
 
     def func_call(self, tree):
-        self.visit(tree.func)
+        yield tree.func
         for arg in tree.args:
-            self.visit(arg)
+            yield arg
 
         ctype = tree.func.ctype
         if tree.func.value in ("printf", "scanf"):
@@ -557,8 +513,8 @@ class Analyzer(Interpreter):
         tree.ctype = ctype.type
 
     def array_access(self, tree):
-        self.visit(tree.array)
-        self.visit(tree.index)
+        yield tree.array
+        yield tree.index
         array_type, index_type = tree.array.ctype, tree.index.ctype
         if index_type != INT:
             self.raise_error("数组下标必须是整数类型", tree.index)
@@ -570,7 +526,7 @@ class Analyzer(Interpreter):
             self.raise_error(f"运算符 '[]' 只能用于指针或数组类型而非 '{array_type}'", tree)
 
     def member_access(self, tree):
-        self.visit(tree.object)
+        yield tree.object
 
         obj_type, member_name = tree.object.ctype, tree.member.value
         if tree.arrow:
@@ -588,7 +544,7 @@ class Analyzer(Interpreter):
         if member_name in comp_type.members:
             tree.ctype = comp_type.members[member_name]
             tree.member.ctype = tree.ctype
-            tree.index = list(comp_type.members.keys()).index(member_name)
+            tree.index = comp_type.layout.index[member_name]
         else:
             self.raise_error(f"类型 '{comp_type}' 中不存在名为 '{member_name}' 的成员", tree.member)
 
@@ -614,7 +570,7 @@ class Analyzer(Interpreter):
 
     @staticmethod
     def string(tree):
-        tree.ctype = ArrayType(CHAR)
+        tree.ctype = array_type(CHAR)
 
     @staticmethod
     def bool(tree):
@@ -626,5 +582,5 @@ class Analyzer(Interpreter):
 
     def __default__(self, tree):
         for child in tree.children:
-            if isinstance(child, Tree):
+            if isinstance(child, ASTNode):
                 self.visit(child)
@@ -0,0 +1,134 @@
+import codecs
+import ctypes
+import math
+
+from compiler.tree import *
+from .symbol import SymbolKind
+from .type import *
+
+
+def wrap(value, bits=32):
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def to_float(value):
+    # 按单精度舍入，溢出时得到inf
+    return ctypes.c_float(value).value
+
+
+class Folder(Visitor):
+    # 常量折叠：在语义分析之后为值可在编译期确定的表达式标注const
+    # 运算语义与Generator生成的指令一致：int为32位补码，除法向零截断，float为单精度
+    def fold(self, tree):
+        # 逆先序即每个节点都在其全部子孙之后访问，无需递归
+        for node in reversed(list(iter_nodes(tree))):
+            self.visit(node)
+        return tree
+
+    @staticmethod
+    def integer(tree):
+        tree.const = wrap(int(tree.value, 0))
+
+    @staticmethod
+    def decimal(tree):
+        tree.const = to_float(float(tree.value))
+
+    @staticmethod
+    def character(tree):
+        tree.const = ord(codecs.decode(tree.value, 'unicode_escape'))
+
+    @staticmethod
+    def bool(tree):
+        tree.const = tree.value
+
+    @staticmethod
+    def identifier(tree):
+        symbol = tree.symbol
+        if symbol and symbol.kind == SymbolKind.CONST and isinstance(symbol.type, EnumType):
+            tree.const = symbol.type.enumerators[symbol.name]
+
+    @staticmethod
+    def expression(tree):
+        # 逗号表达式只有在每一项都是常量时才没有副作用
+        if all(expr.const is not None for expr in tree.exprs):
+            tree.const = tree.exprs[-1].const
+
+    @staticmethod
+    def unary_op(tree):
+        value, ctype = tree.operand.const, tree.operand.ctype
+        if value is None:
+            return
+        if tree.op == '+' and ctype in (INT, FLOAT):
+            tree.const = value
+        elif tree.op == '-' and ctype == INT:
+            tree.const = wrap(-value)
+        elif tree.op == '-' and ctype == FLOAT:
+            tree.const = -value
+        elif tree.op == '!' and ctype in (INT, FLOAT, CHAR, BOOL):
+            tree.const = (value == 0)
+
+    @staticmethod
+    def binary_op(tree):
+        op, left, right = tree.op, tree.left.const, tree.right.const
+        ltype, rtype = tree.left.ctype, tree.right.ctype
+
+        if op in ('&&', '||'):
+            # 短路求值：左操作数已能决定结果时，右操作数不会被求值
+            if left is not None and bool(left) == (op == '||'):
+                tree.const = (op == '||')
+            elif left is not None and right is not None:
+                tree.const = bool(right)
+            return
+        if left is None or right is None:
+            return
+
+        if ltype == INT and rtype == INT:
+            if op in ('/', '%') and (right == 0 or (left == -2 ** 31 and right == -1)):
+                return
+            if op == '+':
+                tree.const = wrap(left + right)
+            elif op == '-':
+                tree.const = wrap(left - right)
+            elif op == '*':
+                tree.const = wrap(left * right)
+            elif op in ('/', '%'):
+                quotient = abs(left) // abs(right)
+                quotient = quotient if (left < 0) == (right < 0) else -quotient
+                tree.const = quotient if op == '/' else left - quotient * right
+            else:
+                tree.const = Folder.compare(op, left, right)
+        elif ltype in (INT, FLOAT) and rtype in (INT, FLOAT):
+            left, right = to_float(left), to_float(right)
+            if op == '+':
+                tree.const = to_float(left + right)
+            elif op == '-':
+                tree.const = to_float(left - right)
+            elif op == '*':
+                tree.const = to_float(left * right)
+            elif op == '/' and right != 0:
+                tree.const = to_float(left / right)
+            elif op in ('==', '!=', '<', '>', '<=', '>='):
+                # 有序比较：任一操作数为NaN时结果为假
+                tree.const = False if math.isnan(left) or math.isnan(right) else Folder.compare(op, left, right)
+        elif ltype == rtype and ltype in (CHAR, BOOL) and op in ('==', '!='):
+            tree.const = Folder.compare(op, left, right)
+
+    @staticmethod
+    def compare(op, left, right):
+        if op == '==':
+            return left == right
+        if op == '!=':
+            return left != right
+        if op == '<':
+            return left < right
+        if op == '>':
+            return left > right
+        if op == '<=':
+            return left <= right
+        if op == '>=':
+            return left >= right
+        return None
+
+    def __default__(self, tree):
+        pass
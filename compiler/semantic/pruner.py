@@ -0,0 +1,105 @@
+from compiler.tree import *
+from .symbol import SymbolKind
+
+
+class Pruner(Visitor):
+    # 死代码剪除：在常量折叠之后、IR生成之前删除不可达的语句与函数
+    # 1. 块中return/break/continue（或必然跳转的语句）之后的语句
+    # 2. 条件为常量的if分支，条件恒假的while/for循环
+    # 3. 从main出发不可达的函数定义及其声明：所有函数都是外部链接的，仅在翻译单元即整个程序时剪除，
+    #    即whole_program为真（多文件链接时为假）且定义了main；没有main的翻译单元（如被链接的库）保留全部函数
+    def __init__(self, whole_program=True):
+        super().__init__()
+        self.whole_program = whole_program
+        self.jumps = set()
+
+    def prune(self, tree):
+        self.jumps.clear()
+        for node in reversed(list(iter_nodes(tree))):
+            self.visit(node)
+        if self.whole_program:
+            self.prune_functions(tree)
+        return tree
+
+    # ===============  语 句  ===============
+
+    @staticmethod
+    def reduce(stmt):
+        # 条件在编译期已知的语句替换为实际执行的部分，折叠后的条件没有副作用
+        while True:
+            if isinstance(stmt, IfStatement) and stmt.cond.const is not None:
+                stmt = stmt.then if stmt.cond.const else (stmt.orelse or EmptyStatement())
+            elif isinstance(stmt, WhileStatement) and stmt.cond.const is not None and not stmt.cond.const:
+                stmt = EmptyStatement()
+            elif isinstance(stmt, ForStatement) and stmt.cond is not None and stmt.cond.const is not None \
+                    and not stmt.cond.const:
+                stmt = Statement([stmt.init]) if stmt.init else EmptyStatement()
+            else:
+                return stmt
+
+    def statement(self, tree):
+        stmts = []
+        for stmt in tree.stmts:
+            stmt = self.reduce(stmt)
+            stmts.append(stmt)
+            if id(stmt) in self.jumps:
+                self.jumps.add(id(tree))
+                break
+        tree.stmts = stmts
+
+    def if_stmt(self, tree):
+        tree.then = self.reduce(tree.then)
+        if tree.orelse:
+            tree.orelse = self.reduce(tree.orelse)
+            if id(tree.then) in self.jumps and id(tree.orelse) in self.jumps:
+                self.jumps.add(id(tree))
+
+    def while_stmt(self, tree):
+        tree.body = self.reduce(tree.body)
+
+    def for_stmt(self, tree):
+        tree.body = self.reduce(tree.body)
+
+    def return_stmt(self, tree):
+        self.jumps.add(id(tree))
+
+    def break_stmt(self, tree):
+        self.jumps.add(id(tree))
+
+    def continue_stmt(self, tree):
+        self.jumps.add(id(tree))
+
+    def __default__(self, tree):
+        pass
+
+    # ===============  函 数  ===============
+
+    @staticmethod
+    def prune_functions(tree):
+        decls = tree.decl.decls
+        funcs = {decl.decl.name.symbol: decl for decl in decls if isinstance(decl, FunctionDefinition)}
+        main = next((symbol for symbol in funcs if symbol.name == 'main'), None)
+        if main is None:
+            return
+
+        reachable, stack = {main}, [main]
+        while stack:
+            for node in iter_nodes(funcs[stack.pop()].body):
+                if isinstance(node, Identifier) and node.symbol is not None and node.symbol.kind == SymbolKind.FUNC:
+                    if node.symbol in funcs and node.symbol not in reachable:
+                        reachable.add(node.symbol)
+                        stack.append(node.symbol)
+
+        unreachable = funcs.keys() - reachable
+        if not unreachable:
+            return
+        pruned = []
+        for decl in decls:
+            if isinstance(decl, FunctionDefinition) and decl.decl.name.symbol in unreachable:
+                continue
+            if isinstance(decl, FunctionDeclaration):
+                decl.decls = [i for i in decl.decls if i.name.symbol not in unreachable]
+                if not decl.decls:
+                    continue
+            pruned.append(decl)
+        tree.decl.decls = pruned
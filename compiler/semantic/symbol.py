@@ -22,29 +22,39 @@ class SymbolKind(Enum):
 
 
 class SymbolTable:
+    # 扁平符号表：symbols保存每个名字当前可见的绑定，查找只需一次字典访问
+    # 每个作用域记录一份撤销日志(名字, 被遮蔽的绑定, 其作用域深度)，离开作用域时按逆序恢复
     def __init__(self):
-        self.stack = []
+        self.symbols = {}
+        self.depths = {}
+        self.undo = []
         self.enter_scope()
 
     def enter_scope(self):
-        self.stack.append({})
+        self.undo.append([])
 
     def leave_scope(self):
-        if len(self.stack) > 1:
-            self.stack.pop()
+        if len(self.undo) > 1:
+            symbols, depths = self.symbols, self.depths
+            for name, symbol, depth in reversed(self.undo.pop()):
+                if symbol is None:
+                    del symbols[name]
+                    del depths[name]
+                else:
+                    symbols[name] = symbol
+                    depths[name] = depth
 
     def define(self, symbol):
-        scope = self.stack[-1]
-        if symbol.name in scope:
+        name, depth = symbol.name, len(self.undo)
+        if self.depths.get(name) == depth:
             return False
         else:
-            scope[symbol.name] = symbol
+            self.undo[-1].append((name, self.symbols.get(name), self.depths.get(name)))
+            self.symbols[name] = symbol
+            self.depths[name] = depth
             if symbol.node is not None:
                 symbol.node.symbol = symbol
             return True
 
     def lookup(self, name):
-        for scope in reversed(self.stack):
-            if name in scope:
-                return scope[name]
-        return None
+        return self.symbols.get(name)
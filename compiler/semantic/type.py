@@ -1,20 +1,21 @@
-class Type:
-    def __eq__(self, other):
-        return isinstance(other, self.__class__)
+import threading
+from weakref import WeakValueDictionary
 
+
+class Type:
+    # 类型对象按结构唯一化，相等性通常即同一性，哈希值即对象标识
+    # 数组长度不参与比较，含数组的派生类型须按结构比较，哈希值也由组成类型的哈希值得出
+    # 序列化（AST缓存）时基本类型与派生类型经由工厂还原，反序列化后仍与进程内的类型对象相同
     def __repr__(self):
         return self.__class__.__name__
 
-    def __hash__(self):
-        return hash(repr(self))
-
 
 class BasicType(Type):
     def __init__(self, name):
         self.name = name
 
-    def __eq__(self, other):
-        return super().__eq__(other) and self.name == other.name
+    def __reduce__(self):
+        return basic_type, (self.name,)
 
     def __repr__(self):
         return self.name
@@ -23,21 +24,36 @@ class BasicType(Type):
 class PointerType(Type):
     def __init__(self, type):
         self.type = type
+        self.hash = hash((PointerType, hash(type)))
+
+    def __reduce__(self):
+        return pointer_type, (self.type,)
 
     def __eq__(self, other):
-        return super().__eq__(other) and self.type == other.type
+        return self is other or (other.__class__ is PointerType and self.type == other.type)
+
+    def __hash__(self):
+        return self.hash
 
     def __repr__(self):
         return str(self.type) + '*'
 
 
 class ArrayType(Type):
+    # 数组类型之间的比较不考虑长度，与元素类型相同的数组互相兼容
     def __init__(self, type, size=None):
         self.type = type
         self.size = size
+        self.hash = hash((ArrayType, hash(type)))
+
+    def __reduce__(self):
+        return array_type, (self.type, self.size)
 
     def __eq__(self, other):
-        return super().__eq__(other) and self.type == other.type
+        return self is other or (other.__class__ is ArrayType and self.type == other.type)
+
+    def __hash__(self):
+        return self.hash
 
     def __repr__(self):
         type = str(self.type)
@@ -49,11 +65,17 @@ class FunctionType(Type):
     def __init__(self, type, params):
         self.type = type
         self.params = params
+        self.hash = hash((FunctionType, hash(type), hash(params)))
+
+    def __reduce__(self):
+        return function_type, (self.type, self.params)
 
     def __eq__(self, other):
-        return (super().__eq__(other) and
-                self.type == other.type and
-                self.params == other.params)
+        return self is other or (other.__class__ is FunctionType and
+                                 self.type == other.type and self.params == other.params)
+
+    def __hash__(self):
+        return self.hash
 
     def __repr__(self):
         type = str(self.type)
@@ -64,13 +86,16 @@ class FunctionType(Type):
 class CompoundType(Type):
     def __init__(self, name, members, union=False):
         self.name = name
-        self.members = members
+        self.members = None
         self.union = union
+        self.layout = None
+        if members is not None:
+            self.complete(members)
 
-    def __eq__(self, other):
-        return (super().__eq__(other) and
-                self.name == other.name and
-                self.union == other.union)
+    def complete(self, members):
+        # 成员确定后一次性计算布局，此后成员访问只需查表
+        self.members = members
+        self.layout = Layout(members, self.union)
 
     def __repr__(self):
         return self.name
@@ -81,16 +106,137 @@ class EnumType(Type):
         self.name = name
         self.enumerators = enumerators
 
-    def __eq__(self, other):
-        return super().__eq__(other) and self.name == other.name
-
     def __repr__(self):
         return self.name
 
 
+# ===============  布 局  ===============
+
+class DataLayout:
+    # 目标数据布局中与本语言有关的部分：基本类型与指针的ABI大小和对齐（字节），布局字符串中未给出的项取LLVM的默认值
+    def __init__(self, layout=''):
+        self.layout = layout
+        aligns = {'i1': 1, 'i8': 1, 'i32': 4, 'f32': 4}
+        pointer = (8, 8)
+        for spec in layout.split('-'):
+            name, *fields = spec.split(':')
+            if name in ('p', 'p0') and fields:
+                size = int(fields[0]) // 8
+                pointer = (size, int(fields[1]) // 8 if len(fields) > 1 else size)
+            elif name in aligns and fields:
+                aligns[name] = int(fields[0]) // 8
+        self.pointer = pointer
+        self.basic = {'int': (4, aligns['i32']), 'float': (4, aligns['f32']), 'char': (1, aligns['i8']),
+                      'bool': (1, aligns['i1']), 'nullptr': pointer}
+
+
+def is_complete(ctype):
+    # 能够确定大小的对象类型；数组须逐层检查元素类型
+    while isinstance(ctype, ArrayType):
+        ctype = ctype.type
+    if isinstance(ctype, CompoundType):
+        return ctype.layout is not None
+    return ctype is not VOID and not isinstance(ctype, FunctionType)
+
+
+def layout_of(ctype, data_layout):
+    if isinstance(ctype, BasicType) and ctype.name in data_layout.basic:
+        return data_layout.basic[ctype.name]
+    elif isinstance(ctype, PointerType):
+        return data_layout.pointer
+    elif isinstance(ctype, ArrayType):
+        size, align = layout_of(ctype.type, data_layout)
+        return size * (ctype.size or 0), align
+    elif isinstance(ctype, CompoundType) and ctype.layout is not None:
+        placement = ctype.layout.place(data_layout)
+        return placement.size, placement.align
+    elif isinstance(ctype, EnumType):
+        return data_layout.basic['int']
+    raise TypeError(f"类型 '{ctype}' 没有确定的大小")
+
+
+class Layout:
+    # 成员下标与目标无关，在类型补全时确定；偏移、大小与对齐取决于目标数据布局，按布局分别计算并缓存
+    # 生成器的大小与对齐同样取自这里，降级得到的LLVM类型与之一致
+    def __init__(self, members, union=False):
+        self.members = members
+        self.union = union
+        self.index = {name: i for i, name in enumerate(members)}
+        self.placements = {}
+
+    def place(self, data_layout):
+        placement = self.placements.get(data_layout.layout)
+        if placement is None:
+            placement = self.placements[data_layout.layout] = Placement(self.members, self.union, data_layout)
+        return placement
+
+
+class Placement:
+    def __init__(self, members, union, data_layout):
+        self.offsets, self.sizes = {}, {}
+        size, align = 0, 1
+        for name, ctype in members.items():
+            member_size, member_align = layout_of(ctype, data_layout)
+            offset = 0 if union else (size + member_align - 1) // member_align * member_align
+            self.offsets[name] = offset
+            self.sizes[name] = member_size
+            size = max(size, offset + member_size)
+            align = max(align, member_align)
+        self.size = (size + align - 1) // align * align
+        self.align = align
+
+
+# ===============  类型工厂  ===============
+
+# 派生类型必须经由以下工厂函数创建，结构相同的类型共享同一对象
+# 键中以id引用组成类型，表项存活期间组成类型也被值对象引用，id不会被复用
+# 未命中时加锁创建，多个线程同时编译时也不会为同一结构创建两个对象
+TYPES = WeakValueDictionary()
+TYPES_LOCK = threading.Lock()
+
+
+def pointer_type(type):
+    key = (PointerType, id(type))
+    ctype = TYPES.get(key)
+    if ctype is None:
+        with TYPES_LOCK:
+            ctype = TYPES.get(key)
+            if ctype is None:
+                ctype = TYPES[key] = PointerType(type)
+    return ctype
+
+
+def array_type(type, size=None):
+    key = (ArrayType, id(type), size)
+    ctype = TYPES.get(key)
+    if ctype is None:
+        with TYPES_LOCK:
+            ctype = TYPES.get(key)
+            if ctype is None:
+                ctype = TYPES[key] = ArrayType(type, size)
+    return ctype
+
+
+def function_type(type, params):
+    params = tuple(params) if params is not None else None
+    key = (FunctionType, id(type), params and tuple(map(id, params)))
+    ctype = TYPES.get(key)
+    if ctype is None:
+        with TYPES_LOCK:
+            ctype = TYPES.get(key)
+            if ctype is None:
+                ctype = TYPES[key] = FunctionType(type, params)
+    return ctype
+
+
 VOID = BasicType('void')
 INT = BasicType('int')
 FLOAT = BasicType('float')
 CHAR = BasicType('char')
 BOOL = BasicType('bool')
 NULL = BasicType('nullptr')
+BASIC_TYPES = {ctype.name: ctype for ctype in (VOID, INT, FLOAT, CHAR, BOOL, NULL)}
+
+
+def basic_type(name):
+    return BASIC_TYPES[name]
@@ -0,0 +1,153 @@
+import json
+import multiprocessing
+import os
+import socketserver
+import tempfile
+import threading
+from pathlib import Path
+
+from llvmlite import binding
+
+from compiler.client import SOCKET_PATH, receive, send
+from compiler.compiler import Compiler
+from compiler.ir.target import thread_context
+from compiler.x86 import ir_to_obj, obj_to_exe, run_exe, run_jit
+
+
+# 客户端可以指定的编译选项，缓存目录、工作目录等由服务端决定
+OPTIONS = {'opt_level', 'pipeline', 'triple', 'cpu', 'features', 'fused'}
+
+
+def run_program(program, jit, stdout_path, conn):
+    # 在子进程中执行程序，标准输出写入文件；程序崩溃只会结束子进程，不影响编译服务
+    fd = os.open(stdout_path, os.O_WRONLY)
+    os.dup2(fd, 1)
+    os.close(fd)
+    try:
+        if jit:
+            exit_code = run_jit(binding.parse_bitcode(program, context=thread_context()))
+        else:
+            exit_code = run_exe(program)
+    except RuntimeError as e:
+        # 缺少main或未定义的符号等，作为诊断信息返回
+        exit_code = e
+    conn.send(exit_code)
+
+
+class Service:
+    # 常驻的编译服务：每组编译选项对应一个预热的编译器，请求之间只新建翻译单元的状态
+    def __init__(self, **options):
+        self.options = options
+        self.compilers = {}
+        self.lock = threading.Lock()
+        # 程序在预先导入llvmlite的forkserver派生的子进程中执行，无需重新启动解释器
+        self.processes = multiprocessing.get_context('forkserver')
+        self.processes.set_forkserver_preload(['compiler.server'])
+
+    def compiler(self, options):
+        unknown = set(options or {}) - OPTIONS
+        if unknown:
+            raise ValueError(f"未知的编译选项: {', '.join(sorted(unknown))}")
+        options = {**self.options, **(options or {})}
+        key = json.dumps(options, sort_keys=True, default=str)
+        with self.lock:
+            if key not in self.compilers:
+                self.compilers[key] = Compiler(**options)
+            return self.compilers[key]
+
+    def compile(self, request):
+        response = {'diagnostics': [], 'output': None, 'exit_code': None, 'stdout': ''}
+        try:
+            file_path = request['file']
+            work_dir = request.get('work_dir') or str(Path(file_path).parent)
+            execute, jit = request.get('execute', False), request.get('jit', False)
+            compiler = self.compiler(request.get('options'))
+            module = compiler.translate(file_path, request.get('source')).module
+            if not (execute and jit):
+                os.makedirs(work_dir, exist_ok=True)
+                name = Path(file_path).stem
+                obj = ir_to_obj(module, work_dir, name, target_machine=compiler.target_machine)
+                response['output'] = str(obj_to_exe(obj, work_dir, name))
+            if execute:
+                program = module.as_bitcode() if jit else response['output']
+                response['exit_code'], response['stdout'] = self.execute(program, jit)
+        except Exception as e:
+            # 任何错误都作为诊断信息返回，连接与服务保持可用
+            response['diagnostics'].append(str(e) or e.__class__.__name__)
+        return response
+
+    def execute(self, program, jit):
+        with tempfile.NamedTemporaryFile(delete=False) as stdout:
+            stdout_path = stdout.name
+        try:
+            receiver, sender = self.processes.Pipe(duplex=False)
+            process = self.processes.Process(target=run_program, args=(program, jit, stdout_path, sender))
+            process.start()
+            sender.close()
+            try:
+                exit_code = receiver.recv()
+            except EOFError:
+                # 子进程未返回退出代码便结束，如程序访问了非法地址
+                exit_code = None
+            process.join()
+            receiver.close()
+            with open(stdout_path, 'rb') as f:
+                output = f.read().decode('utf-8', errors='replace')
+        finally:
+            os.remove(stdout_path)
+        if exit_code is None:
+            raise RuntimeError(f'程序异常终止，退出代码为 {process.exitcode}')
+        if isinstance(exit_code, RuntimeError):
+            raise exit_code
+        return exit_code, output
+
+    def handle(self, request):
+        action = request.get('action', 'compile')
+        if action == 'compile':
+            return self.compile(request)
+        if action == 'ping':
+            return {'pid': os.getpid()}
+        return {'diagnostics': [f"未知的请求 '{action}'"]}
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = receive(self.rfile)
+            except (ConnectionError, ValueError):
+                return
+            if not isinstance(request, dict):
+                send(self.request, {'diagnostics': ['请求必须是JSON对象']})
+                continue
+            if request.get('action') == 'shutdown':
+                send(self.request, {})
+                # shutdown会等待serve_forever退出，须在其他线程中调用
+                threading.Thread(target=self.server.shutdown).start()
+                return
+            send(self.request, self.server.service.handle(request))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path=SOCKET_PATH, **options):
+        self.socket_path = str(socket_path)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        super().__init__(self.socket_path, Handler)
+        self.service = Service(**options)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def serve(socket_path=SOCKET_PATH, **options):
+    with Server(socket_path, **options) as server:
+        print(f'编译服务已启动: {server.socket_path}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
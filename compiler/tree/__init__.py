@@ -1,2 +1,2 @@
-from .transformer import ASTTransformer
+from .transformer import ASTTransformer, InlineASTTransformer
 from .tree import *
@@ -1,13 +1,14 @@
 from types import SimpleNamespace as Meta
 
-from lark import Transformer, Token
+from lark import Token
+from lark.visitors import Transformer_NonRecursive
 from lark import v_args
 
 from .tree import *
 
 
 @v_args(inline=True, meta=True)
-class ASTTransformer(Transformer):
+class ASTTransformer(Transformer_NonRecursive):
     @staticmethod
     def program(meta, *args):
         args = [i for i in args if i is not None]
@@ -77,7 +78,6 @@ class ASTTransformer(Transformer):
     @staticmethod
     def func_def(meta, spec, decl, suffix, body):
         decl.suffix.append(suffix)
-        decl.update()
         return FunctionDefinition(spec, decl, body, meta)
 
 
@@ -102,7 +102,6 @@ class ASTTransformer(Transformer):
     @staticmethod
     def member_item(_, decl, *suffix):
         decl.suffix.extend(suffix)
-        decl.update()
         return decl
 
     @staticmethod
@@ -129,7 +128,6 @@ class ASTTransformer(Transformer):
     @staticmethod
     def func_item(_, decl, suffix):
         decl.suffix.append(suffix)
-        decl.update()
         return decl
 
     @staticmethod
@@ -144,7 +142,6 @@ class ASTTransformer(Transformer):
     def var_item(_, decl, __=None, init=None):
         if init is not None:
             decl.init = init
-            decl.update()
         return decl
 
     @staticmethod
@@ -164,7 +161,6 @@ class ASTTransformer(Transformer):
             i += 1
         if i < len(args):
             decl.init = args[i + 1]
-        decl.update()
         return decl
 
     @staticmethod
@@ -401,3 +397,46 @@ class ASTTransformer(Transformer):
     def IMM(token):
         meta = Meta(line=token.line, column=token.column)
         return Identifier(token.value, meta)
+
+
+class InlineASTTransformer:
+    # 在LALR归约时直接调用ASTTransformer的回调，不构建CST
+    # Lark的内联转换不支持meta参数，这里按首个子节点的起始位置自行推算（与propagate_positions一致）
+    # 新建节点的起始位置即其line/column，列表取首个元素的起始位置
+    # 只有越过前导单词直接返回子节点时（如括号表达式），规则的起始位置与节点自身不同，才另行记录，供上层规则取用，每次解析后清空
+    def __init__(self, transformer=None):
+        self.transformer = transformer or ASTTransformer()
+        self.starts = {}
+
+    def reset(self):
+        self.starts.clear()
+
+    def start_of(self, child):
+        if isinstance(child, Token):
+            return child.line, child.column
+        if isinstance(child, ASTNode):
+            return self.starts.get(child) or (child.line, child.column)
+        if isinstance(child, list) and child:
+            return self.start_of(child[0])
+        return None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        func = getattr(self.transformer, name)
+        if name.isupper():
+            return func
+
+        def callback(children):
+            start = None
+            for child in children:
+                start = self.start_of(child)
+                if start is not None:
+                    break
+            if start is None:
+                return func(None, *children)
+            node = func(Meta(line=start[0], column=start[1]), *children)
+            if isinstance(node, ASTNode) and (node.line, node.column) != start:
+                self.starts[node] = start
+            return node
+        return callback
@@ -1,307 +1,652 @@
-from lark import Tree
+from inspect import isgeneratorfunction
 
 
 # ===============  程 序  ===============
 
-class ASTNode(Tree):
-    def __init__(self, data, children, meta=None):
-        super().__init__(data, children)
+class ASTNode:
+    # 节点只保存命名字段，children按需由字段拼出，仅供打印与通用遍历使用
+    # const为常量折叠得到的编译期值，None表示不是常量
+    __slots__ = ('line', 'column', 'ctype', 'const')
+    data = None
+    nodes = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        ASTNode.nodes.append(cls)
+
+    def __init__(self, meta=None):
         self.line = meta.line if meta else -1
         self.column = meta.column if meta else -1
-
         self.ctype = None
-        self.symbol = None
-        self.index = None
+        self.const = None
+
+    @property
+    def children(self):
+        return []
+
+    def pretty(self, indent_str='  '):
+        return pretty(self, indent_str)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.data!r}, {self.children!r})'
 
 
 class Program(ASTNode):
+    __slots__ = ('decl',)
+    data = 'program'
+
     def __init__(self, decl, meta=None):
-        super().__init__('program', [decl], meta)
+        super().__init__(meta)
         self.decl = decl
 
+    @property
+    def children(self):
+        return [self.decl]
+
 
 # ===============  声 明  ===============
 
 class ExternalDeclaration(ASTNode):
+    __slots__ = ('decls',)
+    data = 'declaration'
+
     def __init__(self, decls, meta=None):
-        super().__init__('declaration', decls, meta)
+        super().__init__(meta)
         self.decls = decls
 
+    @property
+    def children(self):
+        return self.decls
+
 
 class Specifier(ASTNode):
+    __slots__ = ('type',)
+    data = 'specifier'
+
     def __init__(self, type, meta=None):
-        super().__init__('specifier', [type], meta)
+        super().__init__(meta)
         self.type = type
 
+    @property
+    def children(self):
+        return [self.type]
+
 
 class Declarator(ASTNode):
+    __slots__ = ('pointer', 'name', 'suffix', 'init')
+    data = 'declarator'
+
     def __init__(self, name, pointer=False, suffix=None, init=None, meta=None):
-        super().__init__('declarator', [], meta)
+        super().__init__(meta)
         self.pointer = pointer
         self.name = name
         self.suffix = suffix or []
         self.init = init
 
-        self.update()
-
-    def update(self):
-        children = [self.name]
-        if self.pointer:
-            children.insert(0, '*')
+    @property
+    def children(self):
+        children = ['*', self.name] if self.pointer else [self.name]
         children.extend(self.suffix)
         if self.init:
             children.append(self.init)
-        self.children = children
+        return children
 
 
 class Initializer(ASTNode):
+    __slots__ = ('inits',)
+    data = 'initializer'
+
     def __init__(self, inits, meta=None):
-        super().__init__('initializer', inits, meta)
+        super().__init__(meta)
         self.inits = inits
 
+    @property
+    def children(self):
+        return self.inits
+
 
 class ArraySuffix(ASTNode):
+    __slots__ = ('size',)
+    data = 'array_suffix'
+
     def __init__(self, size=None, meta=None):
-        super().__init__('array_suffix', [size] if size else [], meta)
+        super().__init__(meta)
         self.size = size
 
+    @property
+    def children(self):
+        return [self.size] if self.size else []
+
 
 class ParamSuffix(ASTNode):
+    __slots__ = ('params',)
+    data = 'param_suffix'
+
     def __init__(self, params=None, meta=None):
-        super().__init__('param_suffix', params or [], meta)
+        super().__init__(meta)
         self.params = params
 
+    @property
+    def children(self):
+        return self.params or []
+
 
 class Parameter(ASTNode):
+    __slots__ = ('spec', 'decl')
+    data = 'parameter'
+
     def __init__(self, spec, decl, meta=None):
-        super().__init__('parameter', [spec, decl], meta)
+        super().__init__(meta)
         self.spec = spec
         self.decl = decl
 
+    @property
+    def children(self):
+        return [self.spec, self.decl]
+
 
 class FunctionDefinition(ASTNode):
+    __slots__ = ('spec', 'decl', 'body')
+    data = 'func_def'
+
     def __init__(self, spec, decl, body, meta=None):
-        super().__init__('func_def', [spec, decl, body], meta)
+        super().__init__(meta)
         self.spec = spec
         self.decl = decl
         self.body = body
 
+    @property
+    def children(self):
+        return [self.spec, self.decl, self.body]
+
 
 class CompoundDefinition(ASTNode):
+    __slots__ = ('spec', 'decl', 'members')
+    data = 'comp_def'
+
     def __init__(self, spec, decl, members, meta=None):
-        super().__init__('comp_def', [spec, decl] + members, meta)
+        super().__init__(meta)
         self.spec = spec
         self.decl = decl
         self.members = members
 
+    @property
+    def children(self):
+        return [self.spec, self.decl] + self.members
+
 
 class Member(ASTNode):
+    __slots__ = ('spec', 'decls')
+    data = 'member'
+
     def __init__(self, spec, decls, meta=None):
-        super().__init__('member', [spec] + decls, meta)
+        super().__init__(meta)
         self.spec = spec
         self.decls = decls
 
+    @property
+    def children(self):
+        return [self.spec] + self.decls
+
 
 class EnumDefinition(ASTNode):
+    __slots__ = ('decl', 'enumerators')
+    data = 'enum_def'
+
     def __init__(self, decl, enumerators, meta=None):
-        super().__init__('enum_def', [decl] + enumerators, meta)
+        super().__init__(meta)
         self.decl = decl
         self.enumerators = enumerators
 
+    @property
+    def children(self):
+        return [self.decl] + self.enumerators
+
 
 class Enumerator(ASTNode):
+    __slots__ = ('name', 'value')
+    data = 'enumerator'
+
     def __init__(self, name, value=None, meta=None):
-        super().__init__('enumerator', [name, value] if value else [name], meta)
+        super().__init__(meta)
         self.name = name
         self.value = value
 
+    @property
+    def children(self):
+        return [self.name, self.value] if self.value else [self.name]
+
 
 class FunctionDeclaration(ASTNode):
+    __slots__ = ('spec', 'decls')
+    data = 'func_decl'
+
     def __init__(self, spec, decls, meta=None):
-        super().__init__('func_decl', [spec] + decls, meta)
+        super().__init__(meta)
         self.spec = spec
         self.decls = decls
 
+    @property
+    def children(self):
+        return [self.spec] + self.decls
+
 
 class VariableDeclaration(ASTNode):
+    __slots__ = ('spec', 'decls')
+    data = 'var_decl'
+
     def __init__(self, spec, decls, meta=None):
-        super().__init__('var_decl', [spec] + decls, meta)
+        super().__init__(meta)
         self.spec = spec
         self.decls = decls
 
+    @property
+    def children(self):
+        return [self.spec] + self.decls
+
 
 class ArrayDeclaration(ASTNode):
+    __slots__ = ('spec', 'decls')
+    data = 'arr_decl'
+
     def __init__(self, spec, decls, meta=None):
-        super().__init__('arr_decl', [spec] + decls, meta)
+        super().__init__(meta)
         self.spec = spec
         self.decls = decls
 
+    @property
+    def children(self):
+        return [self.spec] + self.decls
+
 
 # ===============  语 句  ===============
 
 class Statement(ASTNode):
+    __slots__ = ('stmts',)
+    data = 'statement'
+
     def __init__(self, stmts, meta=None):
-        super().__init__('statement', stmts, meta)
+        super().__init__(meta)
         self.stmts = stmts
 
+    @property
+    def children(self):
+        return self.stmts
+
 
 class IfStatement(ASTNode):
+    __slots__ = ('cond', 'then', 'orelse')
+    data = 'if_stmt'
+
     def __init__(self, cond, then, orelse=None, meta=None):
-        children = [cond, then, orelse] if orelse else [cond, then]
-        super().__init__('if_stmt', children, meta)
+        super().__init__(meta)
         self.cond = cond
         self.then = then
         self.orelse = orelse
 
+    @property
+    def children(self):
+        return [self.cond, self.then, self.orelse] if self.orelse else [self.cond, self.then]
+
 
 class WhileStatement(ASTNode):
+    __slots__ = ('cond', 'body')
+    data = 'while_stmt'
+
     def __init__(self, cond, body, meta=None):
-        super().__init__('while_stmt', [cond, body], meta)
+        super().__init__(meta)
         self.cond = cond
         self.body = body
 
+    @property
+    def children(self):
+        return [self.cond, self.body]
+
 
 class ForStatement(ASTNode):
+    __slots__ = ('init', 'cond', 'post', 'body')
+    data = 'for_stmt'
+
     def __init__(self, init, cond, post, body, meta=None):
-        children = [i for i in [init, cond, post, body] if i]
-        super().__init__('for_stmt', children, meta)
+        super().__init__(meta)
         self.init = init
         self.cond = cond
         self.post = post
         self.body = body
 
+    @property
+    def children(self):
+        return [i for i in [self.init, self.cond, self.post, self.body] if i]
+
 
 class ExpressionStatement(ASTNode):
+    __slots__ = ('expr',)
+    data = 'expr_stmt'
+
     def __init__(self, expr=None, meta=None):
-        children = expr if isinstance(expr, list) else [expr]
-        children = [i for i in children if i is not None]
-        super().__init__('expr_stmt', children, meta)
+        super().__init__(meta)
         self.expr = expr
 
+    @property
+    def children(self):
+        children = self.expr if isinstance(self.expr, list) else [self.expr]
+        return [i for i in children if i is not None]
+
 
 class ReturnStatement(ASTNode):
+    __slots__ = ('expr',)
+    data = 'return_stmt'
+
     def __init__(self, expr=None, meta=None):
-        super().__init__('return_stmt', [expr] if expr else [], meta)
+        super().__init__(meta)
         self.expr = expr
 
+    @property
+    def children(self):
+        return [self.expr] if self.expr else []
+
 
 class BreakStatement(ASTNode):
-    def __init__(self, meta=None):
-        super().__init__('break_stmt', [], meta)
+    __slots__ = ()
+    data = 'break_stmt'
 
 
 class ContinueStatement(ASTNode):
-    def __init__(self, meta=None):
-        super().__init__('continue_stmt', [], meta)
+    __slots__ = ()
+    data = 'continue_stmt'
 
 
 class EmptyStatement(ASTNode):
-    def __init__(self, meta=None):
-        super().__init__('empty_stmt', [], meta)
+    __slots__ = ()
+    data = 'empty_stmt'
 
 
 # ===============  表达式  ===============
 
 class Expression(ASTNode):
+    __slots__ = ('exprs',)
+    data = 'expression'
+
     def __init__(self, exprs, meta=None):
-        super().__init__('expression', exprs, meta)
+        super().__init__(meta)
         self.exprs = exprs
 
+    @property
+    def children(self):
+        return self.exprs
+
 
 class AssignOp(ASTNode):
+    __slots__ = ('op', 'left', 'right')
+    data = 'assign_op'
+
     def __init__(self, op, left, right, meta=None):
-        super().__init__('assign_op', [left, op, right], meta)
+        super().__init__(meta)
         self.op = op
         self.left = left
         self.right = right
 
+    @property
+    def children(self):
+        return [self.left, self.op, self.right]
+
 
 class BinaryOp(ASTNode):
+    __slots__ = ('op', 'left', 'right')
+    data = 'binary_op'
+
     def __init__(self, op, left, right, meta=None):
-        super().__init__('binary_op', [left, op, right], meta)
+        super().__init__(meta)
         self.op = op
         self.left = left
         self.right = right
 
+    @property
+    def children(self):
+        return [self.left, self.op, self.right]
+
 
 class UnaryOp(ASTNode):
+    __slots__ = ('op', 'operand')
+    data = 'unary_op'
+
     def __init__(self, op, operand, meta=None):
-        super().__init__('unary_op', [op, operand], meta)
+        super().__init__(meta)
         self.op = op
         self.operand = operand
 
+    @property
+    def children(self):
+        return [self.op, self.operand]
+
 
 class PostfixOp(ASTNode):
+    __slots__ = ('op', 'operand')
+    data = 'postfix_op'
+
     def __init__(self, op, operand, meta=None):
-        super().__init__('postfix_op', [operand, op], meta)
+        super().__init__(meta)
         self.op = op
         self.operand = operand
 
+    @property
+    def children(self):
+        return [self.operand, self.op]
+
 
 class FunctionCall(ASTNode):
+    __slots__ = ('func', 'args')
+    data = 'func_call'
+
     def __init__(self, func, args, meta=None):
-        super().__init__('func_call', [func] + args, meta)
+        super().__init__(meta)
         self.func = func
         self.args = args
 
+    @property
+    def children(self):
+        return [self.func] + self.args
+
 
 class ArrayAccess(ASTNode):
+    __slots__ = ('array', 'index')
+    data = 'array_access'
+
     def __init__(self, array, index, meta=None):
-        super().__init__('array_access', [array, index], meta)
+        super().__init__(meta)
         self.array = array
         self.index = index
 
+    @property
+    def children(self):
+        return [self.array, self.index]
+
 
 class MemberAccess(ASTNode):
+    # index为成员在复合类型中的序号，由语义分析填写
+    __slots__ = ('object', 'arrow', 'member', 'index')
+    data = 'member_access'
+
     def __init__(self, object, member, arrow=False, meta=None):
-        children = [object, '.', member] if not arrow else [object, '->', member]
-        super().__init__('member_access', children, meta)
+        super().__init__(meta)
         self.object = object
         self.arrow = arrow
         self.member = member
+        self.index = None
+
+    @property
+    def children(self):
+        return [self.object, '->' if self.arrow else '.', self.member]
 
 
 # ===============  标识符  ===============
 
 class Identifier(ASTNode):
+    __slots__ = ('value', 'symbol')
+    data = 'identifier'
+
     def __init__(self, value, meta=None):
-        super().__init__('identifier', [value], meta)
+        super().__init__(meta)
         self.value = value
+        self.symbol = None
+
+    @property
+    def children(self):
+        return [self.value]
 
 
 # ===============  常 量  ===============
 
 class Integer(ASTNode):
+    __slots__ = ('value',)
+    data = 'integer'
+
     def __init__(self, value, meta=None):
-        super().__init__('integer', [value], meta)
+        super().__init__(meta)
         self.value = value
 
+    @property
+    def children(self):
+        return [self.value]
+
 
 class Decimal(ASTNode):
+    __slots__ = ('value',)
+    data = 'decimal'
+
     def __init__(self, value, meta=None):
-        super().__init__('decimal', [value], meta)
+        super().__init__(meta)
         self.value = value
 
+    @property
+    def children(self):
+        return [self.value]
+
 
 class Character(ASTNode):
+    __slots__ = ('value',)
+    data = 'character'
+
     def __init__(self, value, meta=None):
-        super().__init__('character', [value], meta)
+        super().__init__(meta)
         self.value = value[1:-1]
 
+    @property
+    def children(self):
+        return [f"'{self.value}'"]
+
 
 class String(ASTNode):
+    __slots__ = ('value',)
+    data = 'string'
+
     def __init__(self, value, meta=None):
-        super().__init__('string', [value], meta)
+        super().__init__(meta)
         self.value = value[1:-1]
 
+    @property
+    def children(self):
+        return [f'"{self.value}"']
+
 
 class Bool(ASTNode):
+    __slots__ = ('value',)
+    data = 'bool'
+
     def __init__(self, value, meta=None):
-        super().__init__('bool', [value], meta)
+        super().__init__(meta)
         self.value = (value == 'true')
 
+    @property
+    def children(self):
+        return ['true' if self.value else 'false']
+
 
 class NullPtr(ASTNode):
-    def __init__(self, meta=None):
-        super().__init__('nullptr', [], meta)
-        self.value = None
+    __slots__ = ()
+    data = 'nullptr'
+    value = None
+
+
+# ===============  打 印  ===============
+
+def pretty(tree, indent_str='  '):
+    # 输出格式与lark.Tree.pretty一致，使用显式栈以支持任意嵌套深度
+    lines = []
+    stack = [(tree, 0)]
+    while stack:
+        node, level = stack.pop()
+        if not isinstance(node, ASTNode):
+            lines.append(f'{indent_str * level}{node}\n')
+            continue
+        children = node.children
+        if len(children) == 1 and not isinstance(children[0], ASTNode):
+            lines.append(f'{indent_str * level}{node.data}\t{children[0]}\n')
+        else:
+            lines.append(f'{indent_str * level}{node.data}\n')
+            stack.extend((child, level + 1) for child in reversed(children))
+    return ''.join(lines)
+
+
+def iter_nodes(tree):
+    # 先序遍历，与lark.Tree.iter_subtrees_topdown顺序一致
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ASTNode):
+            yield node
+            stack.extend(reversed(node.children))
+
+
+# ===============  访问器  ===============
+
+class Dispatch(dict):
+    def __init__(self, table, default):
+        super().__init__(table)
+        self.default = default
+
+    def __missing__(self, cls):
+        return self.default
+
+
+class Visitor:
+    # 按节点类型预先建立分派表，避免每次访问都按名称getattr
+    # 生成器形式的访问方法通过 `value = yield child` 访问子节点，由walk以显式栈驱动，嵌套深度不受Python调用栈限制
+    def __init__(self):
+        table, self.coroutines = {}, {}
+        for cls in ASTNode.nodes:
+            method = getattr(self, cls.data, None)
+            if method is None:
+                continue
+            if isgeneratorfunction(method):
+                self.coroutines[cls] = method
+                table[cls] = self.walk
+            else:
+                table[cls] = method
+        self.dispatch = Dispatch(table, self.__default__)
+
+    def visit(self, tree):
+        return self.dispatch[tree.__class__](tree)
+
+    def walk(self, tree):
+        coroutines, dispatch = self.coroutines, self.dispatch
+        stack = [coroutines[tree.__class__](tree)]
+        value = None
+        while stack:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+                continue
+            cls = child.__class__
+            if cls in coroutines:
+                stack.append(coroutines[cls](child))
+                value = None
+            else:
+                value = dispatch[cls](child)
+        return value
+
+    def __default__(self, tree):
+        # 没有对应访问方法的节点依次访问其子节点，与lark.visitors.Interpreter一致
+        return [self.visit(child) for child in tree.children if isinstance(child, ASTNode)]
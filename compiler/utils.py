@@ -1,4 +1,17 @@
+import hashlib
 import os
+import sys
+from pathlib import Path
+
+import lark
+from lark import Lark
+
+CACHE_VERSION = 1
+LARK_CALLBACK_OPTIONS = ('transformer', 'postlex', 'lexer_callbacks', 'edit_terminals')
+# 缓存中的文件经pickle加载，等同于可执行代码，只放在当前用户私有的目录下
+# 默认为用户缓存目录下的ananascc，文法缓存位于其中的grammar子目录，可通过环境变量ANANASCC_CACHE_DIR修改
+USER_CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA') or Path.home() / '.cache') / 'ananascc'
+CACHE_DIR = Path(os.environ.get('ANANASCC_CACHE_DIR') or USER_CACHE_DIR / 'grammar')
 
 
 def is_file(file_path):
@@ -14,3 +27,36 @@ def read_file(file_path):
 def write_file(content, file_path):
     with open(file_path, "w", encoding="utf-8") as f:
         f.write(content)
+
+
+def write_binary(content, file_path):
+    with open(file_path, "wb") as f:
+        f.write(content)
+
+
+def private_dir(path):
+    # 目录不存在时以0700创建；须属于当前用户且其他用户不可写，否则不使用缓存
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if hasattr(os, 'getuid'):
+        return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+    return True
+
+
+def load_lark(file_path, cache_dir=CACHE_DIR, **options):
+    grammar = read_file(file_path)
+    if cache_dir is None:
+        return Lark(grammar, **options)
+
+    # 缓存的读写与校验交给Lark的cache选项：文件内记录文法与选项的哈希，被%import引用的文法文件修改后也会重新构建，损坏时重新构建并覆盖
+    # 文件名按文法与选项区分，避免不同文法或选项的解析器相互覆盖；transformer等回调不参与哈希，加载时重新传入
+    key = '\n'.join([grammar, repr(sorted((k, v) for k, v in options.items() if k not in LARK_CALLBACK_OPTIONS)),
+                     lark.__version__, '%d.%d' % sys.version_info[:2]])
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    if not private_dir(cache_dir):
+        return Lark(grammar, **options)
+    cache_path = Path(cache_dir) / f'{Path(file_path).stem}-{digest[:16]}.lark'
+    return Lark(grammar, cache=str(cache_path), **options)
@@ -1 +1,2 @@
-from .x86 import ir_to_x86, x86_to_exe
\ No newline at end of file
+from .jit import run_jit
+from .x86 import ir_to_obj, ir_to_x86, obj_to_exe, run_exe, x86_to_exe
@@ -0,0 +1,48 @@
+import ctypes
+import ctypes.util
+import functools
+import os
+
+from llvmlite import binding
+
+from compiler.ir.target import create_target_machine
+from .x86 import to_module
+
+
+@functools.cache
+def load_libc():
+    # printf/scanf等外部函数从宿主进程的C运行库中解析
+    name = 'msvcrt' if os.name == 'nt' else 'c'
+    path = ctypes.util.find_library(name)
+    binding.load_library_permanently(path)
+    return ctypes.CDLL(path)
+
+
+def run_jit(ir):
+    libc = load_libc()
+
+    # 执行引擎会接管模块与目标机器的所有权，模块克隆一份以免影响后续保存，目标机器不使用缓存
+    # 即时编译总是以宿主机为目标
+    module = to_module(ir).clone()
+    target_machine = create_target_machine.__wrapped__()
+    module.triple = target_machine.triple
+    module.data_layout = str(target_machine.target_data)
+    # 声明而未定义的符号须能在C运行库（或已载入的库）中找到，否则调用时会访问非法地址
+    # main须在模块内定义（宿主进程自身也有main符号，不能按地址查找），与链接时的未定义引用一致
+    unresolved = [value.name for value in (*module.functions, *module.global_variables)
+                  if value.is_declaration and value.name != 'main' and not value.name.startswith('llvm.')
+                  and not binding.address_of_symbol(value.name)]
+    if not any(function.name == 'main' and not function.is_declaration for function in module.functions):
+        unresolved.insert(0, 'main')
+    if unresolved:
+        raise RuntimeError(f"未定义的符号: {', '.join(unresolved)}")
+    engine = binding.create_mcjit_compiler(module, target_machine)
+    engine.finalize_object()
+    engine.run_static_constructors()
+
+    main = ctypes.CFUNCTYPE(ctypes.c_int)(engine.get_function_address('main'))
+    result = main()
+    # 程序的输出位于C运行库的缓冲区中，须在返回前刷新
+    libc.fflush(None)
+    engine.run_static_destructors()
+    return result
@@ -3,26 +3,56 @@ import subprocess
 import tempfile
 from pathlib import Path
 
-from compiler.utils import is_file
+from llvmlite import binding
 
+from compiler.ir.target import create_target_machine, thread_context
+from compiler.utils import is_file, read_file, write_binary, write_file
 
-def ir_to_x86(ir, file_path='.', file_name='output'):
-    temp_file_name = None
-    if not is_file(ir):
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.ll', delete=False, encoding='utf-8') as temp_file:
-            temp_file.write(ir)
-            ir = temp_file.name
-            temp_file_name = temp_file.name
 
+def to_module(ir):
+    # 接受内存中的模块、IR文本或IR文件路径
+    if isinstance(ir, binding.ModuleRef):
+        return ir
+    module = binding.parse_assembly(read_file(ir) if is_file(ir) else str(ir), context=thread_context())
+    module.verify()
+    return module
+
+
+def target_of(module):
+    # 未指定目标机器时按模块的目标三元组选择，宿主三元组使用宿主CPU
+    if not module.triple or module.triple == binding.get_default_triple():
+        return create_target_machine()
+    return create_target_machine(module.triple)
+
+
+def ir_to_x86(ir, file_path='.', file_name='output', target_machine=None):
+    module = to_module(ir)
     output_path = Path(file_path) / (file_name + '.s')
-    command = ['clang', '-S', ir, '-o', output_path]
-    subprocess.run(command, check=True)
+    write_file((target_machine or target_of(module)).emit_assembly(module), output_path)
+    return output_path
 
-    if not is_file(ir) and os.path.exists(temp_file_name):
-        os.remove(temp_file_name)
+
+def ir_to_obj(ir, file_path='.', file_name='output', target_machine=None):
+    module = to_module(ir)
+    output_path = Path(file_path) / (file_name + '.o')
+    write_binary((target_machine or target_of(module)).emit_object(module), output_path)
+    return output_path
+
+
+def obj_to_exe(obj, file_path='.', file_name='output'):
+    # 目标文件已在进程内生成，clang仅负责链接
+    output_path = Path(file_path) / (file_name + '.exe')
+    command = ['clang', obj, '-o', output_path]
+    subprocess.run(command, check=True)
     return output_path
 
 
+def run_exe(exe):
+    # 退出代码按32位有符号整数解释，与main的返回值一致
+    result = subprocess.run(exe)
+    return result.returncode if result.returncode <= (2**31 - 1) else result.returncode - 2**32
+
+
 def x86_to_exe(x86, file_path='.', file_name='output'):
     temp_file_name = None
     if not is_file(x86):
@@ -35,6 +65,6 @@ def x86_to_exe(x86, file_path='.', file_name='output'):
     command = ['clang', x86, '-o', output_path]
     subprocess.run(command, check=True)
 
-    if not is_file(x86) and os.path.exists(temp_file_name):
+    if temp_file_name and os.path.exists(temp_file_name):
         os.remove(temp_file_name)
     return output_path
@@ -1,2 +1,1163 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from llvmlite import binding
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from compiler.batch import Batch, translate
+from compiler.cache import BuildCache
+from compiler.client import Client
+from compiler.compiler import Compiler
+from compiler.error import CompileError, LexicalError, SemanticError
+from compiler.ir import Generator, Optimizer
+from compiler.ir.optimizer import OPT_LEVELS
+from compiler.ir.target import create_target_machine
+from compiler.lexer import Lexer
+from compiler.parser import Parser
+from compiler.report import TimeReport
+from compiler.semantic import Analyzer, Folder, Pruner
+from compiler.server import Server
+from compiler.semantic.symbol import Symbol, SymbolKind, SymbolTable
+from compiler.semantic.type import BOOL, CHAR, FLOAT, INT, CompoundType, DataLayout, array_type, function_type, pointer_type
+from compiler.tree import FunctionDefinition, Visitor, iter_nodes
+from compiler.utils import load_lark, read_file, write_file
+from compiler.x86 import ir_to_obj, ir_to_x86, run_jit
+
+TEST_DIR = Path(__file__).parent
+TEST_FILES = sorted(TEST_DIR.glob('*.c'))
+
+
+# ===============  测 试  ===============
+
+def generate_source(scale):
+    funcs = []
+    for i in range(scale):
+        funcs.append(f'''
+int func{i}(int a, int *b)
+{{
+    int arr[10];
+    int sum = 0;
+    for (int i = 0; i < 10; i++)
+    {{
+        arr[i] = a * i + *b - i / 3 % 2;
+        if (arr[i] > 5 && sum < 100)
+            sum += arr[i];
+        else
+            sum -= 1;
+    }}
+    while (sum > 10)
+        sum = sum - 3;
+    return sum;
+}}''')
+    calls = ''.join(f'    x = x + func{i}(x, &x);\n' for i in range(scale))
+    funcs.append(f'int main(void)\n{{\n    int x = 1;\n{calls}    return x;\n}}')
+    return '\n'.join(funcs)
+
+
+def test_lark_cache():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        grammar = Path(cache_dir) / 'grammar.lark'
+        write_file('start: A\nA: "a"', grammar)
+        load_lark(grammar, cache_dir, parser='lalr')
+        load_lark(grammar, cache_dir, parser='lalr').parse('a')
+        assert len(list(Path(cache_dir).glob('grammar-*.lark'))) == 1
+
+        # 文法变化后缓存自动失效
+        write_file('start: A\nA: "b"', grammar)
+        load_lark(grammar, cache_dir, parser='lalr').parse('b')
+        assert len(list(Path(cache_dir).glob('grammar-*.lark'))) == 2
+
+        # 损坏的缓存被重新构建
+        for path in Path(cache_dir).glob('grammar-*.lark'):
+            path.write_bytes(b'broken')
+        load_lark(grammar, cache_dir, parser='lalr').parse('b')
+
+        # 被%import引用的文法文件修改后缓存同样失效
+        imports = Path(cache_dir) / 'imports'
+        imports.mkdir()
+        write_file('A: "a"', imports / 'common.lark')
+        write_file('%import common.A\nstart: A', grammar)
+        load_lark(grammar, cache_dir, parser='lalr', import_paths=[str(imports)]).parse('a')
+        write_file('A: "c"', imports / 'common.lark')
+        load_lark(grammar, cache_dir, parser='lalr', import_paths=[str(imports)]).parse('c')
+
+        # 其他用户可写的目录不用作缓存
+        shared = Path(cache_dir) / 'shared'
+        shared.mkdir()
+        shared.chmod(0o777)
+        load_lark(grammar, shared, parser='lalr', import_paths=[str(imports)]).parse('c')
+        assert not list(shared.iterdir())
+
+        for file in TEST_FILES:
+            code = read_file(file)
+            cold = Parser(cache_dir=None).parse(Lexer(cache_dir=None).lex(code))
+            warm = Parser(cache_dir=cache_dir).parse(Lexer(cache_dir=cache_dir).lex(code))
+            assert cold.pretty() == warm.pretty()
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_token_stream():
+    for file in TEST_FILES:
+        code = read_file(file)
+        lexer, parser = Lexer(), Parser()
+        tree = parser.parse(lexer.lex(code))
+
+        stream_lexer, stream_parser = Lexer(), Parser()
+        stream_tree = stream_parser.parse(stream_lexer.lex(code, stream=True))
+        assert stream_lexer.tokens is None
+        assert tree.pretty() == stream_tree.pretty()
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            stream_lexer.save(temp_dir)
+            assert stream_lexer.tokens == lexer.tokens
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+def test_regex_engine():
+    fields = ('type', 'value', 'start_pos', 'line', 'column', 'end_line', 'end_column', 'end_pos')
+    lark_lexer, regex_lexer = Lexer(engine='lark'), Lexer(engine='regex')
+    codes = [read_file(file) for file in TEST_FILES]
+    codes.append('0x1F 0b10 1.5e3 .5 1. 12e4 a.b Type TYPE_A Ab2C forx for if_a /* a\n* b */ x /* '
+                 '"s\\"t" \'\\n\' -> -- -= - && & // tail')
+    for code in codes:
+        expected = [tuple(getattr(t, f) for f in fields) for t in lark_lexer.lex(code)]
+        actual = [tuple(getattr(t, f) for f in fields) for t in regex_lexer.lex(code)]
+        assert expected == actual
+
+    for code in ['int a = @;', 'int a;\n  int $']:
+        errors = []
+        for lexer in (lark_lexer, regex_lexer):
+            try:
+                lexer.lex(code)
+            except LexicalError as e:
+                errors.append((e.line, e.column))
+        assert len(errors) == 2 and errors[0] == errors[1]
+
+
+def dump_positions(tree):
+    return [(node.data, node.line, node.column) for node in iter_nodes(tree)]
+
+
+def test_inline_parser():
+    # 括号表达式越过左括号直接返回内部节点，其上层节点的起始位置仍应是左括号
+    codes = [read_file(file) for file in TEST_FILES] + [
+        'int f(int x, int y) { return x; } int main(void) { int a = 1; a = f((a), 2); (a) = ((a)) * (a + 1) - -(a); return (a); }']
+    for code in codes:
+        tree = Parser().parse(Lexer().lex(code))
+
+        parser = Parser(inline=True)
+        inline_tree = parser.parse(Lexer().lex(code, stream=True))
+        assert parser.cst is None
+        assert tree.pretty() == inline_tree.pretty()
+        assert dump_positions(tree) == dump_positions(inline_tree)
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            parser.save(temp_dir, Lexer().lex(code))
+            assert parser.cst is not None
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+def test_fused_parser():
+    codes = [read_file(file) for file in TEST_FILES] + ['int for;', 'int a = if;', 'int @;', 'int x = (1;']
+    fused = Parser(fused=True)
+    for code in codes:
+        try:
+            expected = Parser().parse(Lexer().lex(code))
+        except CompileError as e:
+            expected = type(e)
+        try:
+            actual = fused.parse_text(code)
+        except CompileError as e:
+            actual = type(e)
+        if isinstance(expected, type):
+            assert actual is expected
+        else:
+            assert expected.pretty() == actual.pretty()
+            assert dump_positions(expected) == dump_positions(actual)
+
+
+def test_visitor():
+    # 没有对应访问方法的节点默认访问其子节点
+    class Collector(Visitor):
+        def __init__(self):
+            super().__init__()
+            self.names = []
+
+        def identifier(self, tree):
+            self.names.append(tree.value)
+
+    tree = Parser(inline=True).parse(Lexer().lex('int f(int a) { return a; } int main(void) { int b = 1; return f(b); }'))
+    collector = Collector()
+    collector.visit(tree)
+    assert collector.names == [node.value for node in iter_nodes(tree) if node.data == 'identifier']
+    assert collector.names[-1] == 'b'
+
+
+def test_symbol_table():
+    table = SymbolTable()
+    outer = Symbol(None, 'a', SymbolKind.VAR)
+    assert table.define(outer)
+    assert not table.define(Symbol(None, 'a', SymbolKind.VAR))
+
+    table.enter_scope()
+    inner = Symbol(None, 'a', SymbolKind.VAR)
+    assert table.define(inner) and table.lookup('a') is inner
+    assert not table.define(Symbol(None, 'a', SymbolKind.VAR))
+    table.enter_scope()
+    assert table.define(Symbol(None, 'b', SymbolKind.VAR)) and table.lookup('a') is inner
+    table.leave_scope()
+    assert table.lookup('b') is None and table.lookup('a') is inner
+    table.leave_scope()
+    assert table.lookup('a') is outer
+    assert not table.define(Symbol(None, 'a', SymbolKind.VAR))
+
+    # 全局作用域不会被弹出
+    table.leave_scope()
+    assert table.lookup('a') is outer
+
+
+def test_type_interning():
+    assert pointer_type(pointer_type(INT)) is pointer_type(pointer_type(INT))
+    assert pointer_type(INT) is not pointer_type(CHAR)
+    assert function_type(INT, [INT, pointer_type(CHAR)]) is function_type(INT, (INT, pointer_type(CHAR)))
+    assert function_type(INT, None) is not function_type(INT, [])
+    assert array_type(INT, 3) is array_type(INT, 3)
+
+    # 数组比较不考虑长度
+    assert array_type(INT, 3) is not array_type(INT, 5) and array_type(INT, 3) == array_type(INT, 5)
+    assert array_type(INT, 3) != array_type(CHAR, 3)
+    assert len({array_type(INT, 3), array_type(INT, 5)}) == 1
+
+    # 指向数组的指针、多维数组与函数类型的比较同样不考虑数组长度，但各自保留原有长度
+    assert pointer_type(array_type(INT, 3)) == pointer_type(array_type(INT, 5))
+    assert pointer_type(array_type(INT, 5)).type.size == 5
+    assert hash(pointer_type(array_type(INT, 3))) == hash(pointer_type(array_type(INT, 5)))
+    assert pointer_type(array_type(INT, 3)) != pointer_type(array_type(CHAR, 3))
+    assert array_type(array_type(INT, 3), 2) == array_type(array_type(INT, 5), 2)
+    assert function_type(INT, [pointer_type(array_type(INT, 3))]) == function_type(INT, [pointer_type(array_type(INT, 5))])
+    Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(
+        'int main(void) { int a[3]; int b[5]; return &a == &b; }')))
+
+    # 未指定长度的数组由初始化列表补全长度，不影响其他同类型的数组
+    tree = Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(
+        'int main(void) { int a[] = {1, 2, 3}; int b[] = {1}; return a[0] + b[0]; }')))
+    decls = [node for node in iter_nodes(tree) if node.data == 'declarator']
+    assert [decl.ctype.size for decl in decls[1:]] == [3, 1]
+
+
+def test_type_lowering():
+    generator = Generator()
+    node = CompoundType('Node', None)
+    node.complete({'value': INT, 'next': pointer_type(node)})
+    value = CompoundType('Value', {'i': INT, 'c': array_type(CHAR, 10), 'f': FLOAT}, union=True)
+
+    assert generator.get_type(pointer_type(INT)) is generator.get_type(pointer_type(INT))
+    assert str(generator.get_type(array_type(INT, 3))) == '[3 x i32]'
+    assert str(generator.get_type(array_type(INT, 5))) == '[5 x i32]'
+    assert str(generator.get_type(function_type(INT, [pointer_type(CHAR)]))) == 'i32 (i8*)'
+    assert generator.get_type(node).elements[1].pointee is generator.get_type(node)
+    # 联合体以对齐要求最高的成员为主体，再补足到最大成员的大小
+    assert [str(element) for element in generator.get_type(value).elements] == ['i32', '[8 x i8]']
+    assert generator.get_layout(node) == (16, 8)
+    assert generator.get_layout(value) == (12, 4)
+    assert generator.get_layout(array_type(INT, 5)) == (20, 4)
+
+
+def test_target_machine():
+    native = create_target_machine()
+    assert native is create_target_machine()
+    assert native.triple == binding.get_default_triple()
+    module = Generator(native).module
+    assert module.triple == native.triple and module.data_layout == str(native.target_data)
+
+    # 覆盖目标三元组后数据布局随之改变
+    generator = Generator(create_target_machine('i686-pc-linux-gnu'))
+    node = CompoundType('Node', None)
+    node.complete({'value': INT, 'next': pointer_type(node)})
+    assert generator.module.triple == 'i686-pc-linux-gnu'
+    assert generator.get_layout(node) == (8, 4)
+    code = 'int main(void) { return 0; }'
+    tree = Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))
+    module = Optimizer(target_machine=generator.target_machine).optimize(generator.generate(tree))
+    assert 'i686-pc-linux-gnu' in str(module)
+
+
+def test_compound_layout():
+    native = DataLayout(str(create_target_machine().target_data))
+    pair = CompoundType('Pair', {'c': CHAR, 'i': INT, 'b': array_type(CHAR, 3)})
+    assert pair.layout.index == {'c': 0, 'i': 1, 'b': 2}
+    assert pair.layout.place(native).offsets == {'c': 0, 'i': 4, 'b': 8}
+    assert (pair.layout.place(native).size, pair.layout.place(native).align) == (12, 4)
+    node = CompoundType('Node', None)
+    node.complete({'pair': pair, 'next': pointer_type(node)})
+    assert node.layout.place(native).offsets == {'pair': 0, 'next': 16}
+    value = CompoundType('Value', {'i': INT, 'c': array_type(CHAR, 10)}, union=True)
+    assert value.layout.place(native).offsets == {'i': 0, 'c': 0}
+    assert value.layout.place(native).sizes == {'i': 4, 'c': 10}
+    boxed = CompoundType('Boxed', {'c': CHAR, 'v': value, 'b': BOOL})
+    assert boxed.layout.place(native).offsets == {'c': 0, 'v': 4, 'b': 16}
+
+    # 大小、对齐与偏移取自目标数据布局，与生成器降级得到的LLVM类型一致
+    for triple, expected in ((None, (24, 8)), ('i686-unknown-linux-gnu', (16, 4))):
+        generator = Generator(create_target_machine(triple))
+        target_data, context = generator.target_data, generator.module.context
+        placement = node.layout.place(generator.data_layout)
+        assert (placement.size, placement.align) == expected == generator.get_layout(node)
+        for ctype in (pair, node, value, boxed):
+            ll_type, placement = generator.get_type(ctype), ctype.layout.place(generator.data_layout)
+            assert generator.get_layout(ctype) == (placement.size, placement.align) == (
+                ll_type.get_abi_size(target_data, context), ll_type.get_abi_alignment(target_data, context))
+            if not ctype.union:
+                assert list(placement.offsets.values()) == [
+                    ll_type.get_element_offset(target_data, i, context) for i in range(len(placement.offsets))]
+
+    # 成员（包括数组成员的元素）为不完整类型时报语义错误
+    for code in ('struct Node { int x; Node arr[2]; };', 'struct Node { void v[2]; };', 'struct Node { Node n; };'):
+        try:
+            compile_ir(code + ' int main(void) { return 0; }')
+            assert False, code
+        except SemanticError as e:
+            assert '不完整' in str(e)
+
+    ir = compile_ir('''
+union Value { int i; float f; };
+struct Node { int v; Node *next; Value w; };
+int main(void)
+{
+    Node a, b;
+    a.next = &b;
+    a.next->v = 3;
+    a.w.f = 1.5;
+    b.w.i = a.next->v;
+    return b.w.i + b.v;
+}''')
+    assert 'ret i32 6' in ir
+    code = '''
+union Value { int i; char c[10]; };
+struct Boxed { char c; Value v; };
+int main(void)
+{
+    Boxed b;
+    b.v.c[9] = 'a';
+    b.v.i = 2;
+    if (b.v.c[9] == 'a') return b.v.i + 5;
+    return 0;
+}'''
+    assert 'ret i32 7' in compile_ir(code)
+    assert '%"Value" = type {i32, [8 x i8]}' in compile_ir(code, optimize=False)
+
+
+def compile_ir(code, fold=True, prune=True, optimize=True):
+    tree = Parser(inline=True).parse(Lexer(engine='regex').lex(code, stream=True))
+    tree = Analyzer().analyze(tree)
+    if fold:
+        tree = Folder().fold(tree)
+    if fold and prune:
+        tree = Pruner().prune(tree)
+    generator = Generator()
+    module = generator.generate(tree)
+    return str(Optimizer().optimize(module) if optimize else generator.module)
+
+
+def test_deep_nesting():
+    limit = sys.getrecursionlimit()
+    depth = 5000
+    codes = [
+        'int main(void) { int a = 1; return ' + '(' * depth + 'a' + ')' * depth + '; }',
+        'int main(void) { int a = 1; bool b = ' + '!' * depth + 'a; return a; }',
+        'int main(void) { int a = 1; ' + '{' * depth + 'a++;' + '}' * depth + ' return a; }',
+        'int main(void) { int a = 1, b; ' + 'b = ' * depth + 'a; return b; }',
+        'int main(void) { int a = 1; ' + ''.join(f'if (a == {i}) a = {i + 1}; else ' for i in range(depth)) + 'a = 0; return a; }',
+        'int main(void) { int a = 1; bool b = ' + ' && '.join(['a > 0'] * depth) + '; return a; }',
+    ]
+    for code in codes:
+        assert 'define i32 @main()' in compile_ir(code)
+    assert sys.getrecursionlimit() == limit
+
+    # 长表达式链的编译时间应随长度线性增长
+    elapsed = []
+    for terms in (25000, 100000):
+        code = 'int main(void) { int a = 1; int b = ' + ' + '.join(['a'] * terms) + '; return b; }'
+        start = time.perf_counter()
+        compile_ir(code)
+        elapsed.append(time.perf_counter() - start)
+    assert elapsed[1] / elapsed[0] < 8
+
+
+def test_constant_folding():
+    ir = compile_ir('int n = 4 * 1024; float f = 1 + 0.5; bool b = 1 < 2; '
+                    'int main(void) { return 2 * 4096 - 3; }', optimize=False)
+    assert '@"n" = global i32 4096' in ir
+    assert '@"f" = global float 0x3ff8000000000000' in ir
+    assert '@"b" = global i1 true' in ir
+    assert 'ret i32 8189' in ir and 'mul' not in ir
+
+    # 折叠结果必须与LLVM对未折叠指令的求值结果一致
+    exprs = ['7 / -2', '-7 % 3', '7 % -3', '2147483647 + 1', '65536 * 65536', '10 - 3 - 2', '-(-2147483647 - 1)',
+             '7.5 / 2 * 3', '1 + 2.5', '(3 > 2) == (2.5 <= 1)', "'a' == 'a'", "'a' != 'b'", '!0 && 1', '0 && 1 / 0',
+             '1 || 1 / 0', '!2.5', 'BLUE', '16777217 * 1.0 == 16777216', '1.0 / 3.0 * 3.0 == 1.0', '-2.5 * 2']
+    for expr in exprs:
+        code = f'enum Color {{ RED, GREEN = 3, BLUE }}; int main(void) {{ int r = {expr}; return r; }}'
+        folded = compile_ir(code).split('ret i32 ')[1].split()[0]
+        unfolded = compile_ir(code, fold=False).split('ret i32 ')[1].split()[0]
+        assert folded == unfolded, expr
+
+    # 无法在编译期转换的常量仍生成转换指令
+    code = ('int f(int *q) { if (q == nullptr) return 3; return 4; } '
+            'int main(void) { int *p = nullptr; p = nullptr; int x = 1e10; return f(nullptr) + f(p); }')
+    ir = compile_ir(code, optimize=False)
+    assert 'bitcast i8* null to i32*' in ir and 'fptosi' in ir
+    assert 'ret i32 6' in compile_ir(code)
+    # 全局变量的初始值只能在编译期转换，超出范围时报语义错误
+    assert '@"g" = global i32 2' in compile_ir('int g = 2.5; int main(void) { return g; }', optimize=False)
+    for decl in ('int g = 1e10;', 'int g = -1e10;', 'bool g = 1e10;', 'char g = 1e3;'):
+        try:
+            compile_ir(decl + ' int main(void) { return 0; }')
+            assert False, decl
+        except SemanticError as e:
+            assert "'g'" in e.msg and e.line == 1
+
+
+def test_dead_code_pruning():
+    code = '''
+int unused(int a);
+int helper(int a) { return a + 1; }
+int unused(int a) { return helper(a) * 2; }
+int never(void) { return unused(1); }
+int main(void)
+{
+    int x = 1;
+    if (0) x = never();
+    if (1 > 2) x = 5; else x = helper(x);
+    while (0) x = x * 3;
+    for (int i = 0; 1 == 2; i++) x = x * 5;
+    {
+        if (x > 0) return x; else return 0;
+        x = 7;
+    }
+    x = 9;
+    return x;
+}'''
+    ir = compile_ir(code, optimize=False)
+    assert '@"helper"' in ir and '@"unused"' not in ir and '@"never"' not in ir
+    assert 'mul' not in ir and 'store i32 7' not in ir and 'store i32 9' not in ir
+    assert compile_ir(code).count('define') == compile_ir(code, prune=False).count('define') - 2
+
+    tree = Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+    body = tree.decl.decls[-1].body.stmts
+    assert [stmt.data for stmt in body] == ['var_decl', 'empty_stmt', 'expr_stmt', 'empty_stmt', 'statement', 'statement']
+    assert [stmt.data for stmt in body[-1].stmts] == ['if_stmt']
+
+    # 没有main时不剪除函数，与其他翻译单元链接时也不剪除
+    ir = compile_ir('int helper(int a) { return a; }', optimize=False)
+    assert '@"helper"' in ir
+    tree = Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code))))
+    tree = Pruner(whole_program=False).prune(tree)
+    assert len([decl for decl in tree.decl.decls if isinstance(decl, FunctionDefinition)]) == 4
+
+
+def test_module_handoff():
+    code = 'int square(int a) { return a * a; }\nint main(void) { return square(3); }'
+    tree = Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+    generator, optimizer = Generator(), Optimizer()
+    module = generator.generate(tree)
+    assert optimizer.optimize(module) is module
+    assert 'ret i32 9' in str(module)
+    # 文本形式的IR仍可直接优化
+    assert 'ret i32 9' in str(Optimizer().optimize(str(generator.module)))
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        generator.save(work_dir)
+        optimizer.save(work_dir)
+        assert read_file(Path(work_dir) / '04 org_ir.txt') == str(generator.module)
+        assert read_file(Path(work_dir) / '04 opt_ir.txt') == str(module)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def test_native_emission():
+    code = 'int main(void) { printf("%d", 42); return 0; }'
+    tree = Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+    module = Optimizer().optimize(Generator().generate(tree))
+    work_dir = tempfile.mkdtemp()
+    try:
+        asm = ir_to_x86(module, work_dir)
+        assert 'main' in read_file(asm) and 'printf' in read_file(asm)
+        obj = ir_to_obj(module, work_dir)
+        assert obj.stat().st_size > 0
+        # 文本形式的IR与内存中的模块生成相同的目标文件
+        assert ir_to_obj(str(module), work_dir, 'text').read_bytes() == obj.read_bytes()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def test_jit_execution():
+    code = '''
+int fact(int n) { if (n <= 1) return 1; return n * fact(n - 1); }
+int main(void)
+{
+    int a[5];
+    for (int i = 0; i < 5; i++) a[i] = fact(i + 1);
+    printf("");
+    return a[4] - a[3] * 6;
+}'''
+    tree = Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+    module = Optimizer().optimize(Generator().generate(tree))
+    assert run_jit(module) == -24
+    # 执行引擎使用模块的副本，原模块仍可继续使用
+    assert run_jit(module) == -24 and 'fact' in str(module)
+    assert run_jit('define i32 @main() {\n  ret i32 -7\n}') == -7
+    # 未定义的外部函数报错而不是在调用时崩溃
+    try:
+        run_jit('declare i32 @missing()\ndefine i32 @main() {\n  %r = call i32 @missing()\n  ret i32 %r\n}')
+        assert False
+    except RuntimeError as e:
+        assert 'missing' in str(e)
+    # 没有定义main时同样报错，而不是调用空地址
+    for ir in ('define i32 @f() {\n  ret i32 1\n}', '', 'declare i32 @main()'):
+        try:
+            run_jit(ir)
+            assert False
+        except RuntimeError as e:
+            assert 'main' in str(e)
+
+
+def test_opt_levels():
+    code = '''
+int sum(int n) { int s = 0; for (int i = 1; i <= n; i++) s = s + i; return s; }
+int main(void) { return sum(10) - 50; }'''
+    tree = Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+    for level, (speed_level, size_level) in OPT_LEVELS.items():
+        generator = Generator()
+        module = Optimizer(speed_level, size_level).optimize(generator.generate(tree))
+        assert run_jit(module) == 5, level
+        if level == '0':
+            assert 'alloca' in str(module)
+        else:
+            assert 'ret i32 5' in str(module), level
+
+    # -Os与-O2一样做循环向量化（-O1不做），但不做SLP向量化
+    codes = {
+        'loop': '''
+int a[256];
+int sum(int n) { int s = 0; for (int i = 0; i < n; i++) s = s + a[i]; return s; }
+int main(void) { for (int i = 0; i < 256; i++) a[i] = i; return sum(256) % 256; }''',
+        'slp': '''
+int a[4]; int b[4]; int c[4];
+void add(void) { a[0] = b[0] + c[0]; a[1] = b[1] + c[1]; a[2] = b[2] + c[2]; a[3] = b[3] + c[3]; }
+int main(void) { b[2] = 3; c[2] = 4; add(); return a[2]; }''',
+    }
+    for name, code in codes.items():
+        vector_tree = Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+        modules = {level: Optimizer(*OPT_LEVELS[level]).optimize(Generator().generate(vector_tree)) for level in '12s'}
+        assert run_jit(modules['s']) == (128 if name == 'loop' else 7)
+        vectorized = {level: ' x i32>' in str(module) for level, module in modules.items()}
+        if name == 'loop':
+            assert vectorized == {'1': False, '2': True, 's': True}
+        else:
+            assert vectorized == {'1': False, '2': True, 's': False}
+
+    generator = Generator()
+    module = Optimizer(pipeline='instcombine,simplifycfg,verify').optimize(generator.generate(tree))
+    assert 'call' in str(module) and run_jit(module) == 5
+    try:
+        Optimizer(pipeline='instcombine,unknown')
+        assert False
+    except ValueError as e:
+        assert 'unknown' in str(e)
+
+
+def test_time_report():
+    code = 'int main(void) { int s = 0; for (int i = 0; i < 10; i++) s = s + i; return s; }'
+    report = TimeReport()
+    with report.stage('parse'):
+        tree = Parser(inline=True).parse(Lexer().lex(code))
+    with report.stage('generate'):
+        module = Generator().generate(Analyzer().analyze(tree))
+    with report.stage('optimize', llvm=True):
+        Optimizer().optimize(module)
+    work_dir = tempfile.mkdtemp()
+    try:
+        with report.stage('emit', llvm=True):
+            ir_to_obj(module, work_dir)
+        report.save(work_dir)
+        trace = json.loads(read_file(Path(work_dir) / 'time_report.json'))
+    finally:
+        shutil.rmtree(work_dir)
+
+    assert [stage['name'] for stage in report.stages] == ['parse', 'generate', 'optimize', 'emit']
+    assert all(stage['wall'] >= 0 and stage['cpu'] >= 0 for stage in report.stages)
+    stages = {item['stage'] for item in report.passes}
+    assert stages == {'optimize', 'emit'}, stages
+    assert 'InstCombinePass' in {item['name'] for item in report.passes}
+    table = report.table()
+    assert 'optimize' in table and 'llvm pass' in table
+    events = trace['traceEvents']
+    assert [event['name'] for event in events if event['cat'] == 'stage'] == ['parse', 'generate', 'optimize', 'emit']
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+
+    # 内存峰值按阶段统计，之前阶段的峰值不会延续到之后的阶段
+    report = TimeReport()
+    with report.stage('allocate'):
+        block = b'x' * (128 * 2 ** 20)
+    del block
+    with report.stage('idle'):
+        pass
+    if report.stages[0]['memory'] is not None:
+        assert report.stages[1]['memory'] < report.stages[0]['memory'] - 64
+
+    # LLVM阶段成功时，捕获到的计时报告以外的输出仍写回标准错误
+    captured, stderr = tempfile.TemporaryFile(), os.dup(2)
+    sys.stderr.flush()
+    os.dup2(captured.fileno(), 2)
+    try:
+        report = TimeReport()
+        with report.stage('optimize', llvm=True):
+            os.write(2, b'warning: kept\n')
+            Optimizer().optimize(Generator().generate(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+    finally:
+        os.dup2(stderr, 2)
+        os.close(stderr)
+    captured.seek(0)
+    output = captured.read().decode('utf-8')
+    captured.close()
+    assert output == 'warning: kept\n' and 'InstCombinePass' in {item['name'] for item in report.passes}
+
+    # 未启用时不记录任何内容
+    report = TimeReport(enabled=False)
+    with report.stage('optimize', llvm=True):
+        pass
+    assert not report.stages and not report.passes
+
+    # 多个线程同时计时LLVM阶段时各自取得完整的结果，标准错误最终恢复原状
+    def optimize(_):
+        report = TimeReport()
+        module = Generator().generate(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code))))
+        with report.stage('optimize', llvm=True):
+            Optimizer().optimize(module)
+        return {item['name'] for item in report.passes}
+
+    stderr = os.fstat(2)
+    with ThreadPoolExecutor(4) as executor:
+        assert all('InstCombinePass' in names for names in executor.map(optimize, range(8)))
+    assert (os.fstat(2).st_ino, os.fstat(2).st_dev) == (stderr.st_ino, stderr.st_dev)
+
+
+def test_batch_compile():
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        write_file('int main(void) { return y; }', work_dir / 'bad.c')
+        write_file('int twice(int a);\nint main(void) { printf(""); return twice(21); }', work_dir / 'main.c')
+        write_file('int twice(int a) { printf(""); return a * 2; }', work_dir / 'twice.c')
+        files = [*TEST_FILES, work_dir / 'bad.c', work_dir / 'main.c', work_dir / 'twice.c']
+
+        serial = Batch(jobs=1).translate([str(file) for file in files])
+        parallel = Batch(jobs=2).translate([str(file) for file in files])
+        assert [unit.file_path for unit in parallel] == [str(file) for file in files]
+        assert [unit.bitcode for unit in parallel] == [unit.bitcode for unit in serial]
+        assert [unit.error is not None for unit in parallel] == [False] * len(TEST_FILES) + [True, False, False]
+        assert "'y'" in parallel[len(TEST_FILES)].error
+
+        units, module = Batch(jobs=2, link=True).compile(files[-2:], execute=True, jit=True)
+        assert all(unit.error is None for unit in units) and 'twice' in str(module)
+
+        # main所在文件中只被其他文件调用的函数在链接时保留
+        write_file('int helper(int a) { return a + 1; }\nint twice(int a);\nint main(void) { return twice(20); }',
+                   work_dir / 'main.c')
+        write_file('int helper(int a);\nint twice(int a) { return helper(a) * 2; }', work_dir / 'twice.c')
+        units, module = Batch(jobs=1, link=True).compile(files[-2:], execute=True, jit=True)
+        assert 'define i32 @helper' in str(module) and run_jit(module) == 42
+
+        # 有文件出错时不链接也不执行；其他异常同样只记录在出错的文件上
+        units, module = Batch(jobs=1, link=True).compile(files[-3:], execute=True, jit=True)
+        assert module is None and [unit.error is not None for unit in units] == [True, False, False]
+        assert translate(str(files[0]), compiler=object()).error is not None
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def test_reentrant_compiler():
+    compiler = Compiler()
+    files = [str(file) for file in TEST_FILES]
+    expected = [str(Compiler().translate(file).module) for file in files]
+    for _ in range(3):
+        assert [str(compiler.translate(file).module) for file in files] == expected
+    with ThreadPoolExecutor(4) as executor:
+        for _ in range(3):
+            assert [str(unit.module) for unit in executor.map(compiler.translate, files * 2)] == expected * 2
+
+    units = compiler.compile_many(files * 3, execute=True, jit=True, threads=4)
+    assert all(unit.error is None for unit in units)
+    assert [unit.exit_code for unit in units] == [unit.exit_code for unit in units[:len(files)]] * 3
+
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        write_file('int main(void) { return z; }', work_dir / 'bad.c')
+        units = compiler.compile_many([work_dir / 'bad.c', files[0]], execute=True, jit=True)
+        assert isinstance(units[0].error, CompileError) and units[1].error is None
+        # 出错后编译器仍可继续使用，save导出最近一次编译的结果
+        compiler.translate(files[0])
+        compiler.save(work_dir)
+        assert read_file(work_dir / '04 opt_ir.txt') == expected[0]
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def test_compile_server():
+    work_dir = Path(tempfile.mkdtemp())
+    server = Server(work_dir / 'test.sock')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        with Client(server.socket_path) as client:
+            assert client.request(action='ping')['pid'] == os.getpid()
+            for file in TEST_FILES:
+                exit_code = run_jit(Compiler().translate(str(file)).module)
+                # 同一连接上反复请求，结果与进程内编译一致
+                for _ in range(2):
+                    response = client.compile(file, execute=True, jit=True)
+                    assert response['diagnostics'] == [] and response['exit_code'] == exit_code
+
+            write_file('int main(void) { int a = 3; printf("a = %d", a); return 7; }', work_dir / 'print.c')
+            response = client.compile(work_dir / 'print.c', execute=True, jit=True)
+            assert (response['exit_code'], response['stdout']) == (7, 'a = 3')
+
+            # 编译错误、未知的选项与崩溃的程序都作为诊断信息返回，服务继续可用
+            write_file('int main(void) { return z; }', work_dir / 'bad.c')
+            response = client.compile(work_dir / 'bad.c', execute=True, jit=True)
+            assert response['diagnostics'] and response['exit_code'] is None
+            response = client.compile(TEST_FILES[0], execute=True, jit=True, bogus=1)
+            assert 'bogus' in response['diagnostics'][0]
+            write_file('int main(void) { int *p = nullptr; return *p; }', work_dir / 'crash.c')
+            response = client.compile(work_dir / 'crash.c', execute=True, jit=True, opt_level='0')
+            assert response['diagnostics'] and response['exit_code'] is None
+            write_file('int f(void) { return 1; }', work_dir / 'lib.c')
+            response = client.compile(work_dir / 'lib.c', execute=True, jit=True)
+            assert 'main' in response['diagnostics'][0] and response['exit_code'] is None
+            assert client.request(action='ping')['pid'] == os.getpid()
+            assert client.compile(TEST_FILES[0], execute=True, jit=True, opt_level='0')['diagnostics'] == []
+            client.request(action='shutdown')
+        thread.join(5)
+        assert not thread.is_alive()
+    finally:
+        server.server_close()
+        shutil.rmtree(work_dir)
+
+
+def test_stop_early():
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        compiler = Compiler(work_dir=str(work_dir))
+        file = str(TEST_FILES[0])
+        expected = str(Compiler().translate(file).module)
+        suffixes = {'tokens': '.tokens', 'ast': '.ast', 'ir': '.ll', 'opt-ir': '.ll', 'asm': '.s', 'obj': '.o'}
+        for emit, suffix in suffixes.items():
+            unit = compiler.compile(file, file_name=emit, emit=emit)
+            assert unit.output == work_dir / f'{emit}{suffix}' and unit.output.stat().st_size > 0
+            # 停止之后的阶段不会运行
+            assert (unit.generator is None) == (emit in ('tokens', 'ast'))
+            assert (unit.module is None or unit.optimizer.module is not None) == (emit != 'ir')
+        assert read_file(work_dir / 'opt-ir.ll') == expected
+        assert 'define' in read_file(work_dir / 'ir.ll') and read_file(work_dir / 'ir.ll') != expected
+
+        write_file('int main(void) { return z; }', work_dir / 'bad.c')
+        try:
+            compiler.check(str(work_dir / 'bad.c'))
+            assert False
+        except CompileError:
+            pass
+        assert compiler.check(file).module is None
+
+        # 只做语法检查时不导入llvmlite与tabulate
+        code = ('import sys; from compiler.compiler import Compiler; Compiler().check(sys.argv[1]); '
+                'print(sorted(name for name in ("llvmlite", "tabulate") if name in sys.modules))')
+        result = subprocess.run([sys.executable, '-c', code, file], cwd=TEST_DIR.parent,
+                                capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == '[]'
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def test_build_cache():
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        files = [shutil.copy(file, work_dir) for file in TEST_FILES]
+        expected = [run_jit(Compiler().translate(file).module) for file in files]
+        cache_dir = work_dir / 'cache'
+        compiler = Compiler(cache_dir=cache_dir)
+        for _ in range(2):
+            units = [compiler.translate(file) for file in files]
+            assert [run_jit(unit.module) for unit in units] == expected
+        # 第二次全部命中位码层，前端与优化均未运行
+        assert all(unit.generator is None for unit in units)
+        assert len(list(cache_dir.glob('*.bc'))) == len(list(cache_dir.glob('*.ast'))) == len(files)
+
+        # 优化级别改变时位码层未命中，AST层命中，只重新生成与优化
+        unit = Compiler(cache_dir=cache_dir, opt_level='0').translate(files[0])
+        assert unit.parser.ast is None and unit.generator is not None
+        assert run_jit(unit.module) == expected[0]
+
+        # 源代码修改后不再命中；损坏的缓存视为未命中
+        write_file(read_file(files[0]) + '\n', files[0])
+        assert compiler.translate(files[0]).generator is not None
+        for path in cache_dir.iterdir():
+            write_file('broken', path)
+        assert run_jit(compiler.translate(files[1]).module) == expected[1]
+        assert compiler.translate(files[1]).generator is None
+
+        # 超过容量上限时淘汰最久未使用的条目
+        cache = BuildCache(work_dir / 'lru', max_size=250)
+        for key in 'abc':
+            cache.store(key, '.bc', b'x' * 100)
+            time.sleep(0.01)
+        assert cache.load('a', '.bc') is None and cache.load('b', '.bc') is not None
+        cache.store('d', '.bc', b'x' * 100)
+        assert sorted(path.name for path in (work_dir / 'lru').iterdir()) == ['b.bc', 'd.bc']
+
+        # 缓存条目可以执行代码，其他用户可写的目录不使用
+        if hasattr(os, 'getuid'):
+            os.chmod(work_dir / 'lru', 0o777)
+            cache = BuildCache(work_dir / 'lru')
+            assert not cache.enabled and cache.load('b', '.bc') is None
+    finally:
+        shutil.rmtree(work_dir)
+
+
+# ===============  基 准  ===============
+
+def bench_startup(repeat=5):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            Lexer(cache_dir=None), Parser(cache_dir=None)
+        cold = (time.perf_counter() - start) / repeat
+
+        Lexer(cache_dir=cache_dir), Parser(cache_dir=cache_dir)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            Lexer(cache_dir=cache_dir), Parser(cache_dir=cache_dir)
+        warm = (time.perf_counter() - start) / repeat
+    finally:
+        shutil.rmtree(cache_dir)
+    print(f'startup: cold {cold * 1000:.1f} ms, warm {warm * 1000:.1f} ms, x{cold / warm:.1f}')
+
+
+def bench_lexer(scale=200):
+    code = '\n'.join(read_file(file) for file in TEST_FILES) * scale
+    for engine in ('lark', 'regex'):
+        lexer = Lexer(engine=engine)
+        start = time.perf_counter()
+        count = sum(1 for _ in lexer.lex(code, stream=True))
+        elapsed = time.perf_counter() - start
+        print(f'lexer[{engine}]: {count} tokens, {count / elapsed:,.0f} tokens/s')
+
+
+def bench_parser(scale=200):
+    code = generate_source(scale)
+    for mode in ('cst', 'inline', 'fused'):
+        parser = Parser(inline=(mode == 'inline'), fused=(mode == 'fused'))
+        tracemalloc.start()
+        start = time.perf_counter()
+        if mode == 'fused':
+            parser.parse_text(code)
+        else:
+            parser.parse(Lexer().lex(code, stream=True))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'parser[{mode}]: {elapsed * 1000:.1f} ms, peak {peak / 2 ** 20:.1f} MiB')
+
+
+def bench_visitor(scale=100, repeat=5):
+    code = generate_source(scale)
+    for mode in ('getattr', 'table'):
+        analyze, generate = [], []
+        for _ in range(repeat):
+            tree = Parser(inline=True).parse(Lexer().lex(code, stream=True))
+            analyzer, generator = Analyzer(), Generator()
+            if mode == 'getattr':
+                for visitor in (analyzer, generator):
+                    visitor.dispatch = NameDispatch(visitor, visitor.dispatch)
+                    visitor.coroutines = NameDispatch(visitor, visitor.coroutines)
+            start = time.perf_counter()
+            analyzer.analyze(tree)
+            middle = time.perf_counter()
+            generator.visit(tree)
+            analyze.append(middle - start)
+            generate.append(time.perf_counter() - middle)
+        print(f'visitor[{mode}]: analyze {min(analyze) * 1000:.1f} ms, generate {min(generate) * 1000:.1f} ms')
+
+
+def bench_ast_memory(scale=200):
+    code = generate_source(scale)
+    parser = Parser(inline=True)
+    tokens = Lexer(engine='regex').lex(code)
+    tracemalloc.start()
+    tree = parser.parse(tokens)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = sum(1 for _ in iter_nodes(tree))
+    print(f'ast: {count} nodes, {size / 2 ** 20:.2f} MiB, {size / count:.1f} B/node')
+
+
+class ScopeStack:
+    # 对照组：逐层作用域字典，查找从内向外遍历
+    def __init__(self):
+        self.stack = [{}]
+
+    def enter_scope(self):
+        self.stack.append({})
+
+    def leave_scope(self):
+        if len(self.stack) > 1:
+            self.stack.pop()
+
+    def define(self, symbol):
+        scope = self.stack[-1]
+        if symbol.name in scope:
+            return False
+        scope[symbol.name] = symbol
+        return True
+
+    def lookup(self, name):
+        for scope in reversed(self.stack):
+            if name in scope:
+                return scope[name]
+        return None
+
+
+def bench_symbol_table(depth=64, symbols=200, repeat=20):
+    # 全局定义大量符号，再在深层嵌套的块中反复查找全局与局部符号
+    names = [f'g{i}' for i in range(symbols)]
+    for table_class in (ScopeStack, SymbolTable):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            table = table_class()
+            for name in names:
+                table.define(Symbol(None, name, SymbolKind.VAR))
+            for level in range(depth):
+                local = f'l{level}'
+                table.enter_scope()
+                table.define(Symbol(None, local, SymbolKind.VAR))
+                for name in names:
+                    table.lookup(name)
+                    table.lookup(local)
+            for _ in range(depth):
+                table.leave_scope()
+        elapsed = time.perf_counter() - start
+        lookups = repeat * depth * symbols * 2
+        print(f'symbol[{table_class.__name__}]: {elapsed * 1000:.1f} ms, {lookups / elapsed:,.0f} lookups/s')
+
+
+def bench_type_lowering(repeat=20000):
+    ctypes = [INT, pointer_type(pointer_type(CHAR)), array_type(array_type(FLOAT, 4), 8),
+              function_type(INT, [pointer_type(INT), array_type(CHAR, 16), FLOAT])]
+    generator = Generator()
+    for mode in ('uncached', 'cached'):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for ctype in ctypes:
+                if mode == 'uncached':
+                    generator.types.clear()
+                generator.get_type(ctype)
+        elapsed = time.perf_counter() - start
+        print(f'get_type[{mode}]: {elapsed / (repeat * len(ctypes)) * 1e6:.2f} us/call')
+
+
+def bench_module_handoff(scale=100, repeat=5):
+    # 对照组：旧流程在生成、校验、优化各阶段之间反复生成并解析IR文本
+    code = generate_source(scale)
+    tree = Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(code)))))
+    for mode in ('text', 'module'):
+        times = []
+        for _ in range(repeat):
+            generator, optimizer = Generator(), Optimizer()
+            start = time.perf_counter()
+            if mode == 'text':
+                generator.visit(tree)
+                ir = str(generator.module)
+                binding.parse_assembly(ir).verify()
+                str(optimizer.optimize(binding.parse_assembly(ir)))
+            else:
+                optimizer.optimize(generator.generate(tree))
+            times.append(time.perf_counter() - start)
+        print(f'handoff[{mode}]: {min(times) * 1000:.1f} ms')
+
+
+def bench_opt_levels(repeat=5):
+    trees = [Pruner().prune(Folder().fold(Analyzer().analyze(Parser(inline=True).parse(Lexer().lex(read_file(file))))))
+             for file in TEST_FILES]
+    for level, (speed_level, size_level) in OPT_LEVELS.items():
+        compile_times, run_times = [], []
+        for _ in range(repeat):
+            modules = [Generator().generate(tree) for tree in trees]
+            start = time.perf_counter()
+            optimizer = Optimizer(speed_level, size_level)
+            for module in modules:
+                optimizer.optimize(module)
+            compile_times.append(time.perf_counter() - start)
+
+            # 程序输出重定向到空设备，即时编译本身也计入运行时间
+            stdout = os.dup(1)
+            null = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(null, 1)
+            try:
+                start = time.perf_counter()
+                for module in modules:
+                    run_jit(module)
+                run_times.append(time.perf_counter() - start)
+            finally:
+                os.dup2(stdout, 1)
+                os.close(stdout)
+                os.close(null)
+        print(f'opt[-O{level}]: optimize {min(compile_times) * 1000:.1f} ms, run {min(run_times) * 1000:.1f} ms')
+
+
+def bench_batch(copies=40):
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        files = []
+        for i in range(copies):
+            for file in TEST_FILES:
+                files.append(work_dir / f'{file.stem}_{i}.c')
+                write_file(read_file(file), files[-1])
+        for jobs in (1, 4):
+            start = time.perf_counter()
+            Batch(jobs=jobs).translate([str(file) for file in files])
+            elapsed = time.perf_counter() - start
+            print(f'batch[-j {jobs}]: {len(files)} files, {elapsed * 1000:.0f} ms, {len(files) / elapsed:.0f} files/s')
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def bench_reentrant_compiler(repeat=20):
+    files = [str(file) for file in TEST_FILES]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for file in files:
+            Compiler().translate(file)
+    fresh = time.perf_counter() - start
+
+    compiler = Compiler()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for file in files:
+            compiler.translate(file)
+    warm = time.perf_counter() - start
+    count = repeat * len(files)
+    print(f'compiler[fresh]: {fresh / count * 1000:.1f} ms/file, [warm]: {warm / count * 1000:.1f} ms/file')
+
+
+def bench_compile_server(repeat=5):
+    # 每次启动新进程编译与向常驻编译服务提交请求的端到端耗时
+    root = str(TEST_DIR.parent)
+    file = str(TEST_FILES[0])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        subprocess.run([sys.executable, '-m', 'compiler', file, '-e', '--jit'], cwd=root,
+                       stdout=subprocess.DEVNULL, check=True)
+    fresh = (time.perf_counter() - start) / repeat
+
+    work_dir = tempfile.mkdtemp()
+    socket_path = str(Path(work_dir) / 'bench.sock')
+    server = subprocess.Popen([sys.executable, '-m', 'compiler', '--serve', '--socket', socket_path], cwd=root,
+                              stdout=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(socket_path):
+            time.sleep(0.01)
+        client = [sys.executable, '-m', 'compiler.client', '--socket', socket_path, file, '-e', '--jit']
+        subprocess.run(client, cwd=root, stdout=subprocess.DEVNULL, check=True)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            subprocess.run(client, cwd=root, stdout=subprocess.DEVNULL, check=True)
+        served = (time.perf_counter() - start) / repeat
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir)
+    print(f'server: fresh process {fresh * 1000:.0f} ms, client {served * 1000:.0f} ms, x{fresh / served:.1f}')
+
+
+def bench_startup_imports(repeat=5):
+    # 不同输出阶段的命令行端到端耗时，越早停止导入的依赖越少
+    root = str(TEST_DIR.parent)
+    file = str(TEST_FILES[0])
+    work_dir = tempfile.mkdtemp()
+    try:
+        for args in (['--syntax-only'], ['--emit', 'ast'], ['--emit', 'opt-ir'], ['-e', '--jit']):
+            elapsed = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, '-m', 'compiler', shutil.copy(file, work_dir)] + args, cwd=root,
+                               stdout=subprocess.DEVNULL, check=True)
+                elapsed.append(time.perf_counter() - start)
+            print(f"cli[{' '.join(args)}]: {min(elapsed) * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def bench_build_cache(repeat=20):
+    # 未命中、仅命中AST层（删去位码层）与命中位码层时每个文件的翻译耗时
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        files = [shutil.copy(file, work_dir) for file in TEST_FILES]
+        for name in ('off', 'ast', 'bitcode'):
+            compiler = Compiler(cache_dir=work_dir / 'cache' if name != 'off' else None)
+            for file in files:
+                compiler.translate(file)
+            elapsed = 0
+            for _ in range(repeat):
+                for file in files:
+                    if name == 'ast':
+                        for path in (work_dir / 'cache').glob('*.bc'):
+                            path.unlink()
+                    start = time.perf_counter()
+                    compiler.translate(file)
+                    elapsed += time.perf_counter() - start
+            print(f'cache[{name}]: {elapsed / (repeat * len(files)) * 1000:.2f} ms/file')
+    finally:
+        shutil.rmtree(work_dir)
+
+
+class NameDispatch(dict):
+    # 对照组：每次访问都按名称getattr，与Lark Interpreter的分派方式相同
+    def __init__(self, visitor, table):
+        super().__init__(table)
+        self.visitor = visitor
+
+    def __getitem__(self, cls):
+        visitor = self.visitor
+        func = getattr(visitor, cls.data, None)
+        if func is None:
+            return visitor.__default__
+        if self is visitor.dispatch and cls in visitor.coroutines:
+            return visitor.walk
+        return func
+
+
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    for name, func in list(globals().items()):
+        if name.startswith('test_'):
+            func()
+            print(f'{name}: ok')
+    for name, func in list(globals().items()):
+        if name.startswith('bench_'):
+            func()